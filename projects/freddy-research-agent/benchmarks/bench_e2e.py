@@ -0,0 +1,211 @@
+"""
+Benchmark: end-to-end ResearchAgent runs against local stand-ins for
+Brave Search, the Moonshot chat API and the crawled websites.
+
+Every scenario (crawl concurrency x pages per query x cache state) runs
+the full pipeline for --queries research queries in its own subprocess,
+so peak RSS belongs to that scenario alone. The stand-in servers run in
+this process and never share the agent's event loop.
+
+  cold  empty search, crawl and LLM caches
+  warm  the same queries again, over the caches filled by a first pass
+
+Results (end-to-end latency percentiles, per-stage span summary,
+throughput, peak RSS) go to --output along with the git commit and the
+settings; --baseline prints the change against an earlier results file.
+
+Usage:
+    python benchmarks/bench_e2e.py --queries 5 --concurrency 4 16 --pages 10 40
+    python benchmarks/bench_e2e.py --output after.json --baseline before.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from agent import ResearchAgent, ResearchConfig, memory_usage, percentile, summarize_spans  # noqa: E402
+from fake_servers import FakeBraveServer, FakeChatServer, FixtureSite  # noqa: E402
+
+
+CACHE_STATES = ("cold", "warm")
+# Stages shown in the table (mean seconds per query); the JSON has all of them
+TABLE_STAGES = ("plan", "search_and_crawl", "dedup", "synthesize")
+
+
+def bench_queries(count: int) -> list:
+    return [f"benchmark topic {i}: trends in storage and grid policy" for i in range(count)]
+
+
+async def run_scenario(spec: dict) -> dict:
+    """One scenario in this (worker) process; agent output goes to stderr"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        config = ResearchConfig(
+            moonshot_api_key="bench",
+            brave_api_key="bench",
+            moonshot_base_url=spec["llm_url"],
+            brave_base_url=spec["search_url"],
+            brave_rate_limit=1000.0,
+            max_search_queries=spec["search_queries"],
+            max_crawl_urls=spec["pages"],
+            max_concurrent_crawls=spec["concurrency"],
+            crawl_adaptive=False,
+            search_cache_path=os.path.join(cache_dir, "search.sqlite"),
+            crawl_cache_path=os.path.join(cache_dir, "crawl.sqlite"),
+            llm_cache_path=os.path.join(cache_dir, "llm.sqlite")
+        )
+        queries = bench_queries(spec["queries"])
+        latencies, spans, peak_rss = [], [], []
+        pages = input_tokens = output_tokens = 0
+        
+        async with ResearchAgent(config) as agent:
+            if spec["cache"] == "warm":
+                for query in queries:
+                    await agent.research(query)
+            
+            start = time.perf_counter()
+            for query in queries:
+                query_start = time.perf_counter()
+                report = await agent.research(query)
+                latencies.append(time.perf_counter() - query_start)
+                spans.extend(report.trace.spans)
+                pages += len(report.sources)
+                input_tokens += report.token_usage["input_tokens"]
+                output_tokens += report.token_usage["output_tokens"]
+                peak_rss.append(report.metrics["memory"]["peak_rss_mb"])
+            wall_s = time.perf_counter() - start
+    
+    return {
+        "name": spec["name"],
+        "concurrency": spec["concurrency"],
+        "pages": spec["pages"],
+        "cache": spec["cache"],
+        "queries": len(queries),
+        "wall_s": wall_s,
+        "queries_per_min": len(queries) / wall_s * 60,
+        "pages_crawled": pages,
+        "pages_per_s": pages / wall_s,
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "latency_max_s": max(latencies),
+        "stages": summarize_spans(spans),
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "peak_rss_mb": max(peak_rss + [memory_usage()["peak_rss_mb"]])
+    }
+
+
+def git_commit() -> dict:
+    def git(*cmd):
+        return subprocess.run(["git", *cmd], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    return {"commit": git("rev-parse", "--short", "HEAD") or None,
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def print_row(r: dict, baseline: dict = None):
+    per_query = {
+        stage: r["stages"].get(stage, {}).get("total_s", 0.0) / r["queries"]
+        for stage in TABLE_STAGES
+    }
+    line = (f"{r['name']:<16} {r['latency_p50_s']:>7.2f}s {r['latency_p95_s']:>7.2f}s "
+            f"{r['queries_per_min']:>7.1f} {r['pages_per_s']:>8.1f} {r['peak_rss_mb']:>7.0f}MB  "
+            + " ".join(f"{per_query[stage]:>6.2f}" for stage in TABLE_STAGES))
+    if baseline is not None:
+        change = (r["latency_p50_s"] - baseline["latency_p50_s"]) / baseline["latency_p50_s"] * 100
+        line += f"   p50 {change:+.1f}% vs baseline"
+    print(line, flush=True)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="End-to-end research agent benchmark")
+    parser.add_argument("--queries", type=int, default=5, help="Research queries per scenario")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 16],
+                        help="Crawl concurrency values to run")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 40],
+                        help="Pages crawled per query values to run")
+    parser.add_argument("--cache", nargs="+", default=list(CACHE_STATES), choices=CACHE_STATES)
+    parser.add_argument("--search-queries", type=int, default=6, help="Brave searches per query")
+    parser.add_argument("--sites", type=int, default=8,
+                        help="Fixture sites the results are spread over (127.0.0.x)")
+    parser.add_argument("--site-latency", type=float, default=0.2, help="Page fetch latency (s)")
+    parser.add_argument("--search-latency", type=float, default=0.3, help="Brave latency (s)")
+    parser.add_argument("--llm-ttft", type=float, default=0.5, help="LLM time to first token (s)")
+    parser.add_argument("--llm-tokens-per-s", type=float, default=200.0, help="LLM output rate")
+    parser.add_argument("--llm-output-tokens", type=int, default=400, help="Tokens per completion")
+    parser.add_argument("--output", "-o", default="bench_e2e.json", help="Results JSON file")
+    parser.add_argument("--baseline", help="Earlier results file to compare p50 latency against")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.worker:
+        spec = json.loads(args.worker)
+        with contextlib.redirect_stdout(sys.stderr):
+            result = await run_scenario(spec)
+        print(json.dumps(result))
+        return
+    
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {r["name"]: r for r in json.load(f)["scenarios"]}
+    
+    sites = [FixtureSite(latency=args.site_latency, host=f"127.0.0.{i + 2}") for i in range(args.sites)]
+    for site in sites:
+        await site.start()
+    search = await FakeBraveServer(latency=args.search_latency,
+                                   result_sites=[site.base_url for site in sites]).start()
+    llm = await FakeChatServer(ttft=args.llm_ttft, tokens_per_s=args.llm_tokens_per_s,
+                               output_tokens=args.llm_output_tokens).start()
+    
+    results = []
+    try:
+        print(f"\n{args.queries} queries per scenario, {args.search_queries} searches each\n")
+        print(f"{'scenario':<16} {'p50':>8} {'p95':>8} {'q/min':>7} {'pages/s':>8} {'peak RSS':>9}  "
+              + " ".join(f"{stage[:6]:>6}" for stage in TABLE_STAGES))
+        for concurrency, pages, cache in itertools.product(args.concurrency, args.pages, args.cache):
+            spec = {
+                "name": f"c{concurrency}-p{pages}-{cache}",
+                "concurrency": concurrency, "pages": pages, "cache": cache,
+                "queries": args.queries, "search_queries": args.search_queries,
+                "llm_url": llm.base_url, "search_url": search.url
+            }
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, __file__, "--worker", json.dumps(spec),
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            stdout, stderr = await proc.communicate()
+            lines = stdout.decode().strip().splitlines()
+            if proc.returncode != 0 or not lines:
+                error = (stderr.decode().strip().splitlines() or ["unknown error"])[-1]
+                print(f"{spec['name']:<16} failed: {error[:100]}")
+                continue
+            result = json.loads(lines[-1])
+            results.append(result)
+            print_row(result, baseline.get(result["name"]))
+    finally:
+        await llm.stop()
+        await search.stop()
+        for site in sites:
+            await site.stop()
+    
+    with open(args.output, "w") as f:
+        json.dump({
+            **git_commit(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "settings": {k: v for k, v in vars(args).items() if k not in ("worker", "output", "baseline")},
+            "scenarios": results
+        }, f, indent=2)
+    print(f"\nStage columns: mean seconds per query. Results: {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,137 @@
+"""
+Benchmark: pages/sec and peak RSS of the crawl fetch tiers against a
+local fixture site.
+
+Each tier runs in its own subprocess so peak RSS (sampled across the
+process and its children, i.e. including Chromium) is not polluted by
+the other tiers.
+
+  static   plain pooled GET + in-process markdown extraction
+  browser  headless Chromium via Crawl4AI for every page
+  auto     static first, browser fallback (mix of articles and JS apps)
+
+Usage:
+    python benchmarks/bench_fetch_tiers.py --pages 100
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import psutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from agent import ContentCrawler, CrawlFrontier  # noqa: E402
+from fake_servers import FixtureSite  # noqa: E402
+
+
+TIERS = ("static", "browser", "auto")
+
+
+class PeakRSS:
+    """Samples RSS of this process plus all children in a background thread"""
+    
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def _sample(self) -> int:
+        proc = psutil.Process()
+        total = proc.memory_info().rss
+        for child in proc.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+    
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._sample())
+            self._stop.wait(self.interval)
+    
+    def __enter__(self) -> "PeakRSS":
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._sample())
+
+
+async def run_tier(tier: str, pages: int, concurrency: int) -> dict:
+    async with FixtureSite() as site:
+        if tier == "auto":
+            # One in five pages is a client-rendered shell that needs the browser
+            apps = pages // 5
+            urls = site.article_urls(pages - apps) + site.app_urls(apps)
+        else:
+            urls = site.article_urls(pages)
+        
+        crawler = ContentCrawler(
+            max_concurrent=concurrency,
+            fetch_mode="browser" if tier == "browser" else "auto"
+        )
+        frontier = CrawlFrontier()
+        await frontier.add_results([{"url": url} for url in urls])
+        await frontier.close()
+        
+        with PeakRSS() as rss:
+            start = time.perf_counter()
+            results = await crawler.crawl_frontier(frontier)
+            elapsed = time.perf_counter() - start
+        await crawler.close()
+    
+    return {
+        "tier": tier,
+        "pages": len(urls),
+        "succeeded": len(results),
+        "seconds": elapsed,
+        "pages_per_sec": len(results) / elapsed if elapsed else 0.0,
+        "peak_rss_mb": rss.peak / (1024 * 1024),
+        "counts": crawler.crawl_counts
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl fetch tier benchmark")
+    parser.add_argument("--pages", type=int, default=100, help="Pages per tier")
+    parser.add_argument("--concurrency", type=int, default=5, help="Concurrent fetches")
+    parser.add_argument("--tiers", nargs="+", default=list(TIERS), choices=TIERS)
+    parser.add_argument("--worker", choices=TIERS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.worker:
+        print(json.dumps(asyncio.run(run_tier(args.worker, args.pages, args.concurrency))))
+        return
+    
+    print(f"\n{args.pages} pages per tier, concurrency {args.concurrency}\n")
+    print(f"{'tier':<8} {'ok':>5} {'pages/s':>9} {'peak RSS':>10}  counts")
+    for tier in args.tiers:
+        proc = subprocess.run(
+            [sys.executable, __file__, "--worker", tier,
+             "--pages", str(args.pages), "--concurrency", str(args.concurrency)],
+            capture_output=True, text=True
+        )
+        lines = proc.stdout.strip().splitlines()
+        if proc.returncode != 0 or not lines:
+            error = (proc.stderr.strip().splitlines() or ["unknown error"])[-1]
+            print(f"{tier:<8} unavailable: {error[:80]}")
+            continue
+        r = json.loads(lines[-1])
+        print(f"{tier:<8} {r['succeeded']:>5} {r['pages_per_sec']:>9.1f} "
+              f"{r['peak_rss_mb']:>8.0f}MB  static={r['counts']['static']} "
+              f"browser={r['counts']['browser']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark: event-loop lag and crawl throughput with HTML->markdown
+conversion in the event loop vs in a process pool.
+
+Heavy fixture articles are crawled through the static tier while a probe
+task sleeps in short ticks and records how late it wakes up; that lateness
+is the stall every other in-flight crawl and API call would see.
+
+  inline  PruningContentFilter + markdown generation in the event loop
+  pool    the same work in a ProcessPoolExecutor (--workers, default: cores)
+
+Usage:
+    python benchmarks/bench_markdown_pool.py --pages 200 --paragraphs 400
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from agent import AIMDController, ContentCrawler, HostScheduler, percentile  # noqa: E402
+from fake_servers import FixtureSite  # noqa: E402
+
+
+async def lag_probe(lags: list, stop: asyncio.Event, tick: float = 0.005):
+    """Record how much later than `tick` each sleep returns"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(tick)
+        lags.append(time.perf_counter() - start - tick)
+
+
+async def run(mode: str, site: FixtureSite, args) -> None:
+    concurrency = args.concurrency
+    crawler = ContentCrawler(
+        timeout=60,
+        fetch_mode="auto",
+        markdown_workers=args.workers if mode == "pool" else 0,
+        scheduler=HostScheduler(
+            AIMDController(concurrency, minimum=concurrency, maximum=concurrency),
+            per_host=concurrency
+        )
+    )
+    if mode == "pool":
+        # Start the workers (and their imports) outside the timed section
+        await asyncio.gather(*[
+            crawler.to_markdown("<p>warm up</p>", "http://warm.up/")
+            for _ in range(args.workers * 2)
+        ])
+
+    lags = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(lag_probe(lags, stop))
+    start = time.perf_counter()
+    pages = await crawler.crawl_urls(site.article_urls(args.pages), max_urls=args.pages)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe
+    await crawler.close()
+
+    ms = [lag * 1000 for lag in lags]
+    print(f"{mode:<7} {len(pages):>4} pages  {len(pages) / elapsed:7.1f} pages/s   "
+          f"loop lag p50 {statistics.median(ms):6.1f} ms  p99 {percentile(ms, 99):7.1f} ms  "
+          f"max {max(ms):7.1f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Markdown process pool benchmark")
+    parser.add_argument("--pages", type=int, default=200, help="Pages to crawl per mode")
+    parser.add_argument("--paragraphs", type=int, default=400,
+                        help="Paragraphs per fixture article (page weight)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent fetches")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Process pool size")
+    args = parser.parse_args()
+
+    async with FixtureSite(paragraphs=args.paragraphs) as site:
+        for mode in ("inline", "pool"):
+            await run(mode, site, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""
+Benchmark: per-query latency of BraveSearchClient with and without a
+pooled session, against a local Brave stand-in.
+
+"per-query session" reproduces the old behaviour (a fresh ClientSession,
+and therefore a fresh TCP connection, for every search); "pooled session"
+reuses one keep-alive session for the whole run.
+
+Usage:
+    python benchmarks/bench_search_session.py --queries 200
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from agent import BraveSearchClient, TokenBucket  # noqa: E402
+from fake_servers import FakeBraveServer  # noqa: E402
+
+
+def summarize(label: str, latencies: list) -> None:
+    ms = sorted(l * 1000 for l in latencies)
+    p95 = ms[int(len(ms) * 0.95) - 1]
+    print(f"{label:<20} mean {statistics.mean(ms):7.2f} ms   "
+          f"p50 {statistics.median(ms):7.2f} ms   p95 {p95:7.2f} ms")
+
+
+def unlimited() -> TokenBucket:
+    """Effectively no rate limit, so only connection handling is measured"""
+    return TokenBucket(1e6)
+
+
+async def run_per_query_session(url: str, queries: int) -> list:
+    latencies = []
+    for i in range(queries):
+        start = time.perf_counter()
+        async with BraveSearchClient("bench", base_url=url, rate_limiter=unlimited()) as client:
+            await client.search(f"query {i}")
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def run_pooled_session(url: str, queries: int) -> list:
+    latencies = []
+    async with BraveSearchClient("bench", base_url=url, rate_limiter=unlimited()) as client:
+        for i in range(queries):
+            start = time.perf_counter()
+            await client.search(f"query {i}")
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Brave session pooling benchmark")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per mode")
+    parser.add_argument("--latency", type=float, default=0.0, help="Server latency (s)")
+    args = parser.parse_args()
+    
+    async with FakeBraveServer(latency=args.latency) as server:
+        # Warm up the server once so neither mode pays first-request costs
+        await run_pooled_session(server.url, 5)
+        
+        before = await run_per_query_session(server.url, args.queries)
+        after = await run_pooled_session(server.url, args.queries)
+    
+    print(f"\n{args.queries} queries per mode against {server.url}\n")
+    summarize("per-query session", before)
+    summarize("pooled session", after)
+    speedup = statistics.mean(before) / statistics.mean(after)
+    print(f"\nPooled session is {speedup:.2f}x faster per query")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,327 @@
+"""
+Local stand-in servers for offline benchmarks.
+
+These mimic just enough of the real APIs for the research agent to run
+against them without network access or API keys.
+"""
+
+import asyncio
+import json
+import random
+import re
+import time
+import zlib
+from typing import List, Optional
+
+from aiohttp import web
+
+
+# =============================================================================
+# BRAVE SEARCH STAND-IN
+# =============================================================================
+
+class FakeBraveServer:
+    """
+    Brave-compatible web search endpoint serving synthetic results.
+    
+    With `result_sites` (FixtureSite base URLs) results point at fixture
+    articles spread across those sites, so the agent can crawl them. Each
+    query maps to a deterministic run of consecutive articles out of
+    `article_pool`; a smaller pool makes result lists overlap more.
+    """
+    
+    PATH = "/res/v1/web/search"
+    
+    def __init__(self, results_per_query: int = 10, latency: float = 0.0,
+                 result_host: str = "example.com", result_sites: Optional[List[str]] = None,
+                 article_pool: int = 1000):
+        self.results_per_query = results_per_query
+        self.latency = latency
+        self.result_host = result_host
+        self.result_sites = result_sites
+        self.article_pool = article_pool
+        self.requests = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.port: Optional[int] = None
+    
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}{self.PATH}"
+    
+    def _result_url(self, query: str, slug: str, i: int) -> str:
+        if not self.result_sites:
+            return f"https://{self.result_host}/{slug}/{i}"
+        n = (zlib.crc32(query.encode()) + i) % self.article_pool
+        return f"{self.result_sites[n % len(self.result_sites)]}/article/{n}"
+    
+    async def _handle_search(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        
+        query = request.query.get("q", "")
+        count = min(int(request.query.get("count", self.results_per_query)), 20)
+        slug = "-".join(query.lower().split())[:40] or "query"
+        results = [
+            {
+                "title": f"{query} - result {i}",
+                "url": self._result_url(query, slug, i),
+                "description": f"Synthetic snippet {i} for {query}",
+                "age": "1 day ago"
+            }
+            for i in range(count)
+        ]
+        return web.json_response({"web": {"results": results}})
+    
+    async def start(self) -> "FakeBraveServer":
+        app = web.Application()
+        app.router.add_get(self.PATH, self._handle_search)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+    
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+    
+    async def __aenter__(self) -> "FakeBraveServer":
+        return await self.start()
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+
+# =============================================================================
+# OPENAI-COMPATIBLE CHAT STAND-IN
+# =============================================================================
+
+class FakeChatServer:
+    """
+    OpenAI-compatible /chat/completions endpoint (what MoonshotProvider
+    talks to) with configurable latency and token counts.
+    
+    Every completion waits `ttft` before its first token, then produces
+    `output_tokens` tokens at `tokens_per_s`; streamed requests get them as
+    SSE chunks with usage on the final chunk. Prompts asking for search
+    queries "one per line" are answered with that many query lines, and
+    requests with a `response_format` with a JSON research plan, so the
+    pipeline gets usable keywords.
+    """
+    
+    PATH = "/v1/chat/completions"
+    CHUNK_TOKENS = 8
+    
+    def __init__(self, ttft: float = 0.3, tokens_per_s: float = 200.0,
+                 output_tokens: int = 400, seed: int = 3):
+        self.ttft = ttft
+        self.tokens_per_s = tokens_per_s
+        self.output_tokens = output_tokens
+        self.seed = seed
+        self.requests = 0
+        self.tokens_out = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.port: Optional[int] = None
+    
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+    
+    def _completion(self, prompt: str, structured: bool = False) -> List[str]:
+        """Output as a list of word tokens (one word ~ one token)"""
+        rng = random.Random(zlib.crc32(prompt.encode()) + self.seed)
+        if structured:
+            match = re.search(r"(\d+) diverse", prompt)
+            plan = {
+                "sub_topics": [" ".join(rng.choice(WORDS) for _ in range(2)) for _ in range(4)],
+                "queries": [
+                    {"query": " ".join(rng.choice(WORDS) for _ in range(4)), "priority": rng.randint(1, 3)}
+                    for _ in range(int(match.group(1)) if match else 10)
+                ],
+                "source_types": ["news", "academic papers"]
+            }
+            return [token + " " for token in json.dumps(plan).split(" ")]
+        if "one per line" in prompt:
+            match = re.search(r"Generate (\d+)", prompt)
+            count = int(match.group(1)) if match else 10
+            return [
+                " ".join(rng.choice(WORDS) for _ in range(4)) + "\n"
+                for _ in range(count)
+            ]
+        return [rng.choice(WORDS) + " " for _ in range(self.output_tokens)]
+    
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        body = await request.json()
+        prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+        tokens = self._completion(prompt, structured="response_format" in body)
+        self.tokens_out += len(tokens)
+        usage = {
+            "prompt_tokens": len(prompt) // 4,
+            "completion_tokens": len(tokens),
+            "total_tokens": len(prompt) // 4 + len(tokens)
+        }
+        base = {"id": f"cmpl-{self.requests}", "created": int(time.time()), "model": body.get("model")}
+        await asyncio.sleep(self.ttft)
+        
+        if not body.get("stream"):
+            await asyncio.sleep(len(tokens) / self.tokens_per_s)
+            return web.json_response(dict(
+                base, object="chat.completion", usage=usage,
+                choices=[{"index": 0, "finish_reason": "stop",
+                          "message": {"role": "assistant", "content": "".join(tokens)}}]
+            ))
+        
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        
+        async def send(chunk: dict):
+            await response.write(f"data: {json.dumps(dict(base, object='chat.completion.chunk', **chunk))}\n\n".encode())
+        
+        for i in range(0, len(tokens), self.CHUNK_TOKENS):
+            part = tokens[i:i + self.CHUNK_TOKENS]
+            if i:
+                await asyncio.sleep(len(part) / self.tokens_per_s)
+            await send({"choices": [{"index": 0, "delta": {"content": "".join(part)},
+                                     "finish_reason": None}]})
+        await send({"choices": [], "usage": usage})
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+    
+    async def start(self) -> "FakeChatServer":
+        app = web.Application()
+        app.router.add_post(self.PATH, self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+    
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+    
+    async def __aenter__(self) -> "FakeChatServer":
+        return await self.start()
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+
+# =============================================================================
+# FIXTURE WEBSITE
+# =============================================================================
+
+WORDS = (
+    "research quantum computing error correction qubit hardware lattice "
+    "surface code latency throughput benchmark energy grid battery storage "
+    "policy regulation market pricing analysis growth adoption survey data "
+    "model training inference dataset evaluation method result trend report"
+).split()
+
+
+class FixtureSite:
+    """
+    Deterministic local website for crawl benchmarks.
+    
+    /article/<n> are server-rendered articles (navigation, a few hundred
+    words of body text, footer). /app/<n> are client-rendered shells that
+    only contain a root div and a script bundle.
+    
+    With `max_concurrent` set, requests beyond that many in flight get a
+    429 with Retry-After, like a site protecting itself from crawlers.
+    `host` may be any loopback address (127.0.0.x) to stand in for several
+    distinct sites.
+    """
+    
+    def __init__(self, paragraphs: int = 12, latency: float = 0.0, seed: int = 7,
+                 host: str = "127.0.0.1", max_concurrent: Optional[int] = None,
+                 retry_after: float = 1.0):
+        self.paragraphs = paragraphs
+        self.latency = latency
+        self.seed = seed
+        self.host = host
+        self.max_concurrent = max_concurrent
+        self.retry_after = retry_after
+        self.requests = 0
+        self.throttled = 0
+        self._in_flight = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.port: Optional[int] = None
+    
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+    
+    def article_urls(self, count: int):
+        return [f"{self.base_url}/article/{i}" for i in range(count)]
+    
+    def app_urls(self, count: int):
+        return [f"{self.base_url}/app/{i}" for i in range(count)]
+    
+    def article_html(self, n: int) -> str:
+        rng = random.Random(self.seed * 100_003 + n)
+        paragraphs = "\n".join(
+            f"<p>{' '.join(rng.choice(WORDS) for _ in range(60))}.</p>"
+            for _ in range(self.paragraphs)
+        )
+        nav = " ".join(f'<a href="/article/{i}">Article {i}</a>' for i in range(n, n + 10))
+        return f"""<!doctype html>
+<html><head><title>Fixture article {n}</title>
+<link rel="stylesheet" href="/static/site.css"></head>
+<body><nav>{nav}</nav>
+<article><h1>Fixture article {n}</h1>
+{paragraphs}
+</article>
+<footer>Copyright Fixture Site. <a href="/privacy">Privacy</a></footer>
+</body></html>"""
+    
+    def app_html(self, n: int) -> str:
+        return f"""<!doctype html>
+<html><head><title>Fixture app {n}</title></head>
+<body><noscript>You need to enable JavaScript to run this app.</noscript>
+<div id="root"></div><script src="/static/bundle.js"></script></body></html>"""
+    
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.max_concurrent is not None and self._in_flight >= self.max_concurrent:
+            self.throttled += 1
+            return web.Response(status=429, headers={"Retry-After": f"{self.retry_after:g}"})
+        self._in_flight += 1
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+        finally:
+            self._in_flight -= 1
+        kind = request.match_info["kind"]
+        n = int(request.match_info["n"])
+        html = self.article_html(n) if kind == "article" else self.app_html(n)
+        return web.Response(text=html, content_type="text/html",
+                            headers={"ETag": f'"{kind}-{n}-{self.seed}"'})
+    
+    async def start(self) -> "FixtureSite":
+        app = web.Application()
+        app.router.add_get("/{kind:article|app}/{n:\\d+}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+    
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+    
+    async def __aenter__(self) -> "FixtureSite":
+        return await self.start()
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
@@ -6,15 +6,38 @@ This version uses ONLY Moonshot/Kimi models for unified ecosystem.
 """
 
 import asyncio
+import contextlib
+import contextvars
+import gzip
+import hashlib
+import heapq
+import inspect
+import math
+import mmap
+import multiprocessing
 import os
-from dataclasses import dataclass
-from typing import List, Optional, Dict, Any
+import re
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+import weakref
+import zlib
+from collections import Counter
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field, replace
+from typing import Awaitable, Callable, List, Optional, Dict, Any
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 import json
 
 # Core dependencies
-from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig
+from crawl4ai import AsyncWebCrawler, BrowserConfig, CacheMode, CrawlerRunConfig
 from crawl4ai.content_filter_strategy import PruningContentFilter
-from crawl4ai.markdown_generation_strategy import DefaultMarkdownGenerator
+from crawl4ai.markdown_generation_strategy import DefaultMarkdownGenerator, MarkdownGenerationStrategy
+from crawl4ai.models import MarkdownGenerationResult
 
 # Moonshot API (OpenAI-compatible)
 from openai import AsyncOpenAI
@@ -22,11 +45,21 @@ from openai import AsyncOpenAI
 # HTTP client for Brave Search
 import aiohttp
 
+# Vectorized passage scoring
+import numpy as np
+
 
 # =============================================================================
 # CONFIGURATION
 # =============================================================================
 
+# Default location for on-disk caches
+CACHE_DIR = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "freddy-research-agent"
+)
+
+
 @dataclass
 class ResearchConfig:
     """Configuration for the research agent - Moonshot Only"""
@@ -35,21 +68,961 @@ class ResearchConfig:
     moonshot_api_key: Optional[str] = None
     brave_api_key: Optional[str] = None
     
+    # API Endpoints (point these at local stand-ins for offline benchmarks)
+    moonshot_base_url: str = "https://api.moonshot.ai/v1"
+    brave_base_url: Optional[str] = None     # None: BraveSearchClient.BASE_URL
+    
     # Model Selection (Moonshot Only)
     fast_model: str = "kimi-k2-turbo-preview"       # For analysis, keywords
     strong_model: str = "kimi-k2.5"                 # For synthesis
     
+    # Planning ("structured": one JSON-mode call for sub-topics and
+    # prioritized queries, "keywords": a plain query list, see QueryAnalyzer)
+    planning_mode: str = "structured"
+    
     # Research Limits
     max_search_queries: int = 10
     max_crawl_urls: int = 20
-    max_concurrent_crawls: int = 5
-    crawl_timeout: int = 30
+    max_concurrent_crawls: int = 5       # Starting crawl concurrency (adapted by AIMD)
+    crawl_max_concurrency: int = 16      # Ceiling for the adaptive limit
+    crawl_adaptive: bool = True          # False: always max_concurrent_crawls
+    crawl_per_host: int = 2              # Concurrent fetches per host
+    crawl_host_delay: float = 0.0        # Min seconds between fetch starts on one host
+    crawl_latency_target: float = 10.0   # Slower fetches stop the limit from growing
+    markdown_workers: int = 0            # >0: HTML->markdown in a process pool of this size
+    spool_pages: bool = True             # Keep page text in a compressed disk spool, not RAM
+    max_page_chars: int = 200_000        # Longer pages are truncated
+    crawl_timeout: int = 30              # Per-URL deadline (seconds)
+    crawl_stage_timeout: Optional[float] = 120.0   # Whole crawl stage deadline
+    crawl_hedge_factor: float = 1.0      # e.g. 1.5 starts 50% extra candidates, cancels the rest
+    crawl_fetch_mode: str = "auto"       # "auto": static GET first, browser if JS-dependent
+    static_min_words: int = 150          # Less text than this means the page needs a browser
+    browser_resource_profile: str = "lean"   # See RESOURCE_PROFILES: off, lean, strict
+    blocked_domains: List[str] = field(default_factory=list)  # Extra hosts to block
+    keep_browser_warm: bool = False      # Reuse one Chromium across research runs (daemon mode)
+    rank_fusion_k: int = 60              # Reciprocal-rank fusion constant
+    rank_fusion_warmup: int = 2          # Result lists to fuse before crawling starts
+    
+    # Brave Search Rate Limits (see BRAVE_RATE_TIERS)
+    brave_tier: str = "free"
+    brave_rate_limit: Optional[float] = None   # Requests/sec, overrides tier
+    max_concurrent_searches: int = 5
+    
+    # HTTP Connection Pool (shared Brave Search session)
+    http_pool_limit: int = 100           # Total open connections
+    http_pool_limit_per_host: int = 10   # Connections per host
+    dns_cache_ttl: int = 300             # Seconds to cache DNS lookups
+    keepalive_timeout: float = 30.0      # Seconds to keep idle connections open
+    
+    # Synthesis ("single" or "map_reduce", see SynthesisEngine)
+    synthesis_mode: str = "single"
+    map_concurrency: int = 5               # Parallel per-source summaries
+    map_source_max_tokens: int = 6000      # Content sent per source in the map step
+    map_token_budget: int = 300_000        # Total map input tokens across sources
+    reduce_fan_in: int = 8                 # Summaries merged per reduce call
+    
+    # Near-Duplicate Elimination (MinHash + LSH, see NearDuplicateFilter)
+    enable_dedup: bool = True
+    dedup_threshold: float = 0.8           # Estimated Jaccard similarity to count as duplicate
+    dedup_snippets: bool = False           # Skip crawling URLs whose search snippet was already seen
+    
+    # Passage Selection (BM25 ranking of crawled content, single-call synthesis)
+    enable_passage_selection: bool = True
+    context_token_budget: int = 8000       # Source tokens packed into the synthesis prompt
+    passage_tokens: int = 200              # Target passage size
+    
+    # Search Result Cache (SQLite, see SQLiteCache)
+    enable_search_cache: bool = True
+    search_cache_path: str = os.path.join(CACHE_DIR, "search_cache.sqlite")
+    search_cache_ttl: int = 24 * 3600      # Seconds before a cached search expires
+    search_cache_max_mb: float = 50.0
+    
+    # Crawl Cache (SQLite, compressed markdown keyed by canonical URL)
+    enable_crawl_cache: bool = True
+    crawl_cache_path: str = os.path.join(CACHE_DIR, "crawl_cache.sqlite")
+    crawl_cache_fresh_s: int = 24 * 3600        # Served without revalidation
+    crawl_cache_max_age_s: int = 30 * 24 * 3600  # Revalidated until this age, then dropped
+    crawl_cache_max_mb: float = 500.0
+    
+    # LLM Response Cache (SQLite, keyed on model + temperature + prompt hash)
+    enable_llm_cache: bool = True
+    llm_cache_path: str = os.path.join(CACHE_DIR, "llm_cache.sqlite")
+    llm_cache_ttl: int = 7 * 24 * 3600     # Seconds before a cached response expires
+    llm_cache_max_mb: float = 200.0
+    llm_replay: bool = False               # Serve only from cache, fail on a miss
+    
+    # Record / Replay of all Brave, Moonshot and crawl traffic (see Cassette)
+    cassette_path: Optional[str] = None    # Archive file; None disables
+    cassette_mode: str = "replay"          # "record" live responses or "replay" them offline
+    cassette_latency_scale: float = 1.0    # Replay waits: 1 = as recorded, 0 = none
     
     # Cost Controls
     max_cost_usd: float = 1.00
     enable_cost_tracking: bool = True
 
 
+# Requests per second allowed by each Brave Search subscription plan
+BRAVE_RATE_TIERS = {
+    "free": 1.0,
+    "base": 20.0,
+    "pro": 50.0,
+}
+
+
+# =============================================================================
+# TRACING
+# =============================================================================
+
+@dataclass
+class Span:
+    """One timed pipeline step; times are seconds since the trace started"""
+    id: int
+    parent: Optional[int]
+    stage: str                   # plan, search, crawl, llm, synthesize, ...
+    name: str                    # query, URL or model
+    start_s: float
+    end_s: Optional[float] = None
+    outcome: str = "ok"          # ok, error, cancelled, or a stage-specific value
+    attrs: Dict[str, Any] = field(default_factory=dict)   # tokens, bytes, cache hits, ...
+    
+    @property
+    def duration_s(self) -> float:
+        return (self.end_s if self.end_s is not None else self.start_s) - self.start_s
+    
+    def set(self, outcome: Optional[str] = None, **attrs):
+        if outcome is not None:
+            self.outcome = outcome
+        self.attrs.update(attrs)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id, "parent": self.parent, "stage": self.stage, "name": self.name,
+            "start_s": round(self.start_s, 6), "end_s": round(self.end_s or self.start_s, 6),
+            "duration_s": round(self.duration_s, 6), "outcome": self.outcome, **self.attrs
+        }
+
+
+class Trace:
+    """
+    Spans recorded during one research run.
+    
+    The running trace and the innermost open span live in context
+    variables, so tasks spawned during the run (searches, crawl workers,
+    map calls) attach their spans to it without the trace being passed
+    around.
+    """
+    
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.spans: List[Span] = []
+    
+    @contextlib.contextmanager
+    def span(self, stage: str, name: str = "", **attrs):
+        span = Span(len(self.spans), _current_span.get(), stage, name,
+                    time.perf_counter() - self._t0, attrs=attrs)
+        self.spans.append(span)
+        token = _current_span.set(span.id)
+        try:
+            yield span
+        except asyncio.CancelledError:
+            span.outcome = "cancelled"
+            raise
+        except Exception as e:
+            span.set(outcome="error", error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            span.end_s = time.perf_counter() - self._t0
+            _current_span.reset(token)
+    
+    @contextlib.contextmanager
+    def activate(self):
+        """Make this the trace that `trace_span` records into"""
+        token = _current_trace.set(self)
+        try:
+            yield self
+        finally:
+            _current_trace.reset(token)
+    
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        return summarize_spans(self.spans)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "spans": [span.to_dict() for span in self.spans],
+            "summary": self.summary()
+        }
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+_current_span: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("span", default=None)
+
+# Numeric span attributes summed per stage in summaries
+TRACE_TOTALS = ("input_tokens", "output_tokens", "bytes", "results")
+
+
+@contextlib.contextmanager
+def trace_span(stage: str, name: str = "", **attrs):
+    """Span in the active trace; a detached (unrecorded) span if none is active"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield Span(-1, None, stage, name, 0.0, attrs=attrs)
+        return
+    with trace.span(stage, name, **attrs) as span:
+        yield span
+
+
+def annotate(**attrs):
+    """Add attributes to the innermost open span of the active trace, if any"""
+    trace = _current_trace.get()
+    span_id = _current_span.get()
+    if trace is not None and span_id is not None:
+        trace.spans[span_id].set(**attrs)
+
+
+def summarize_spans(spans: List[Span]) -> Dict[str, Dict[str, Any]]:
+    """Per-stage count, latency percentiles, outcomes and totals"""
+    by_stage: Dict[str, List[Span]] = {}
+    for span in spans:
+        by_stage.setdefault(span.stage, []).append(span)
+    
+    summary = {}
+    for stage, stage_spans in by_stage.items():
+        durations = [span.duration_s for span in stage_spans]
+        stats: Dict[str, Any] = {
+            "count": len(stage_spans),
+            "total_s": sum(durations),
+            "p50_s": percentile(durations, 50),
+            "p95_s": percentile(durations, 95),
+            "max_s": max(durations),
+            "outcomes": dict(Counter(span.outcome for span in stage_spans))
+        }
+        for key in TRACE_TOTALS:
+            values = [span.attrs[key] for span in stage_spans if isinstance(span.attrs.get(key), (int, float))]
+            if values:
+                stats[key] = sum(values)
+        summary[stage] = stats
+    return summary
+
+
+def write_trace(path: str, traces: List[Trace]):
+    """Write runs plus a summary across all of them to a JSON trace file"""
+    with open(path, "w") as f:
+        json.dump({
+            "runs": [trace.to_dict() for trace in traces],
+            "summary": summarize_spans([span for trace in traces for span in trace.spans])
+        }, f, indent=2, default=str)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Linearly interpolated percentile (q in 0-100) of `values`"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    pos = (len(ordered) - 1) * q / 100
+    lo = math.floor(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+# =============================================================================
+# RATE LIMITING
+# =============================================================================
+
+class TokenBucket:
+    """
+    Async token-bucket rate limiter.
+    
+    Tokens refill continuously at `rate` per second up to `capacity`, so
+    callers may burst up to `capacity` requests and then proceed at `rate`.
+    Waiters are served in arrival order. Server rate-limit headers can
+    lower the rate and capacity at runtime, never raise them above the
+    configured values.
+    """
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.configured_rate = self.rate
+        self.configured_capacity = self.capacity
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+    
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+    
+    async def acquire(self, tokens: float = 1.0):
+        """Wait until `tokens` are available and consume them"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+    
+    def block_for(self, seconds: float):
+        """Pause all acquisitions for `seconds`, then allow a single request"""
+        until = time.monotonic() + max(0.0, seconds)
+        self._blocked_until = max(self._blocked_until, until)
+        self._tokens = min(self.capacity, 1.0)
+        self._updated = self._blocked_until
+    
+    def update_from_headers(self, headers) -> None:
+        """
+        Adapt to server rate-limit headers.
+        
+        Handles `Retry-After` and Brave's comma-separated
+        `X-RateLimit-Limit/Remaining/Reset/Policy` headers, whose first
+        entry is the shortest (per-second) window.
+        """
+        retry_after = headers.get("Retry-After")
+        if retry_after:
+            try:
+                self.block_for(float(retry_after))
+            except ValueError:
+                pass
+        
+        def first_number(name: str) -> Optional[float]:
+            value = headers.get(name)
+            if not value:
+                return None
+            try:
+                return float(value.split(",")[0].split(";")[0].strip())
+            except ValueError:
+                return None
+        
+        limit = first_number("X-RateLimit-Limit")
+        remaining = first_number("X-RateLimit-Remaining")
+        reset = first_number("X-RateLimit-Reset")
+        
+        # Policy looks like "1;w=1, 15000;w=2592000" - derive the window length
+        window = 1.0
+        policy = headers.get("X-RateLimit-Policy")
+        if policy:
+            for part in policy.split(",")[0].split(";")[1:]:
+                key, _, value = part.strip().partition("=")
+                if key == "w":
+                    try:
+                        window = float(value)
+                    except ValueError:
+                        pass
+        
+        # The plan's limit caps a slower configured rate, it doesn't raise it
+        if limit and window > 0:
+            self.rate = min(self.configured_rate, limit / window)
+            self.capacity = min(self.configured_capacity, max(1.0, limit))
+            self._tokens = min(self._tokens, self.capacity)
+        if remaining is not None and remaining <= 0 and reset is not None:
+            self.block_for(reset)
+    
+    async def __aenter__(self) -> "TokenBucket":
+        await self.acquire()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        return None
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    TokenBucket whose schedule lives in shared memory, for one rate across
+    several worker processes.
+    
+    `state` is a multiprocessing.Value('d') holding the theoretical arrival
+    time of the next request (GCRA): every process spaces its requests from
+    it, so together they stay at `rate` with bursts of up to `capacity`.
+    time.monotonic() is system-wide on Linux and macOS, so the timestamps
+    compare across processes.
+    """
+    
+    def __init__(self, rate: float, state, capacity: Optional[float] = None):
+        super().__init__(rate, capacity)
+        self._state = state
+    
+    async def acquire(self, tokens: float = 1.0):
+        """Reserve the next slot in the shared schedule and wait for it"""
+        with self._state.get_lock():
+            now = time.monotonic()
+            tat = max(self._state.value, now)
+            allowed_at = tat - (self.capacity - 1) / self.rate
+            self._state.value = tat + tokens / self.rate
+        if allowed_at > now:
+            await asyncio.sleep(allowed_at - now)
+    
+    def block_for(self, seconds: float):
+        """Pause acquisitions in every process for `seconds`"""
+        with self._state.get_lock():
+            until = time.monotonic() + max(0.0, seconds)
+            self._state.value = max(self._state.value, until + (self.capacity - 1) / self.rate)
+
+
+class AIMDController:
+    """
+    Additive-increase / multiplicative-decrease concurrency limit.
+    
+    Healthy completions (no congestion, latency within `latency_target`,
+    recent error rate below `max_error_rate`) raise the limit by about one
+    per window of `limit` completions; a congestion signal (a timeout) cuts
+    it by `decrease`. Failures from the same burst only cut once: another
+    cut needs a full window of completions first.
+    """
+    
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 16,
+                 decrease: float = 0.5, latency_target: Optional[float] = None,
+                 max_error_rate: float = 0.5):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.max_error_rate = max_error_rate
+        self.error_rate = 0.0            # EWMA over recent completions
+        self.cuts = 0
+        self._since_cut = math.inf
+    
+    def record(self, latency: float, ok: bool, congested: bool = False):
+        self._since_cut += 1
+        self.error_rate = 0.9 * self.error_rate + 0.1 * (0.0 if ok else 1.0)
+        
+        if congested:
+            if self._since_cut >= self.limit and self.limit > self.minimum:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                self.cuts += 1
+                self._since_cut = 0
+            return
+        
+        healthy = (
+            ok
+            and self.error_rate < self.max_error_rate
+            and (self.latency_target is None or latency <= self.latency_target)
+        )
+        if healthy:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+
+class HostScheduler:
+    """
+    Politeness scheduler for page fetches.
+    
+    A fetch starts only when the global in-flight count is below the AIMD
+    controller's current limit, its host is below its own cap, at least
+    `host_delay` seconds have passed since the host's previous fetch
+    started, and the host is not in a throttling backoff (Retry-After, or
+    `backoff` seconds by default).
+    
+    Throttling (429/503) is handled per host: it halves that host's cap,
+    and the host wins a slot back after `recover_after` clean fetches per
+    slot, so one rate-limited site slows down without holding back the
+    others. Timeouts cut the global AIMD limit.
+    """
+    
+    def __init__(self, controller: AIMDController, per_host: int = 2,
+                 host_delay: float = 0.0, backoff: float = 5.0, recover_after: int = 10):
+        self.controller = controller
+        self.per_host = max(1, per_host)
+        self.host_delay = host_delay
+        self.backoff = backoff
+        self.recover_after = recover_after
+        self._cond = asyncio.Condition()
+        self._in_flight = 0
+        self._host_in_flight: Dict[str, int] = {}
+        self._host_cap: Dict[str, int] = {}
+        self._host_clean: Dict[str, int] = {}
+        self._host_last_start: Dict[str, float] = {}
+        self._host_blocked_until: Dict[str, float] = {}
+        self.reset_stats()
+    
+    def reset_stats(self):
+        self.stats = {"peak_in_flight": 0, "host_waits": 0, "throttled": 0, "cuts_at_start": self.controller.cuts}
+    
+    def _host_wait(self, host: str, now: float) -> float:
+        """Seconds until `host` may start another fetch (ignoring caps)"""
+        wait = self._host_blocked_until.get(host, 0.0) - now
+        if self.host_delay and host in self._host_last_start:
+            wait = max(wait, self._host_last_start[host] + self.host_delay - now)
+        return wait
+    
+    async def _acquire(self, host: str):
+        async with self._cond:
+            waited = False
+            while True:
+                now = time.monotonic()
+                wait = self._host_wait(host, now)
+                host_full = self._host_in_flight.get(host, 0) >= self._host_cap.get(host, self.per_host)
+                if wait <= 0 and not host_full and self._in_flight < int(self.controller.limit):
+                    break
+                if host_full or wait > 0:
+                    waited = True
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout=wait if wait > 0 else None)
+                except asyncio.TimeoutError:
+                    pass
+            
+            self._in_flight += 1
+            self._host_in_flight[host] = self._host_in_flight.get(host, 0) + 1
+            self._host_last_start[host] = now
+            self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self._in_flight)
+            if waited:
+                self.stats["host_waits"] += 1
+    
+    async def _release(self, host: str):
+        async with self._cond:
+            self._in_flight -= 1
+            self._host_in_flight[host] -= 1
+            if not self._host_in_flight[host]:
+                del self._host_in_flight[host]
+            self._cond.notify_all()
+    
+    @contextlib.asynccontextmanager
+    async def slot(self, url: str):
+        """
+        Hold a fetch slot for `url`. The caller fills in the yielded dict
+        (`ok`, `throttled`, `timed_out`, `retry_after`) so the outcome feeds
+        the AIMD controller and the host's backoff.
+        """
+        host = (urlsplit(url).hostname or "").lower()
+        await self._acquire(host)
+        start = time.monotonic()
+        outcome = {"ok": False, "throttled": False, "timed_out": False, "retry_after": None}
+        try:
+            yield outcome
+        except asyncio.CancelledError:
+            # Cancelled by the crawl deadline or hedging - says nothing about the host
+            outcome = None
+            raise
+        finally:
+            await self._release(host)
+            if outcome is not None:
+                self._record(host, time.monotonic() - start, outcome)
+    
+    def _record(self, host: str, latency: float, outcome: Dict[str, Any]):
+        cap = self._host_cap.get(host, self.per_host)
+        if outcome["throttled"]:
+            self.stats["throttled"] += 1
+            delay = outcome["retry_after"] or self.backoff
+            self._host_blocked_until[host] = max(
+                self._host_blocked_until.get(host, 0.0), time.monotonic() + delay
+            )
+            self._host_cap[host] = max(1, cap // 2)
+            self._host_clean[host] = 0
+        elif outcome["ok"] and cap < self.per_host:
+            self._host_clean[host] = self._host_clean.get(host, 0) + 1
+            if self._host_clean[host] >= self.recover_after * cap:
+                self._host_cap[host] = cap + 1
+                self._host_clean[host] = 0
+        self.controller.record(latency, ok=outcome["ok"], congested=outcome["timed_out"])
+    
+    def report(self) -> Dict[str, Any]:
+        return {
+            "limit": round(self.controller.limit, 2),
+            "cuts": self.controller.cuts - self.stats["cuts_at_start"],
+            "peak_in_flight": self.stats["peak_in_flight"],
+            "host_waits": self.stats["host_waits"],
+            "throttled": self.stats["throttled"]
+        }
+
+
+# =============================================================================
+# CACHING
+# =============================================================================
+
+class SQLiteCache:
+    """
+    Persistent key/value cache backed by a single SQLite table.
+    
+    Values are JSON-serialized (and zlib-compressed if `compress` is set,
+    with `max_bytes` counting compressed size). Every entry has an expiry time, and the
+    cache is kept under `max_bytes` by evicting least-recently-used
+    entries. Hit/miss counters are kept per instance.
+    """
+    
+    def __init__(self, path: str, table: str = "cache", default_ttl: Optional[float] = None,
+                 max_bytes: int = 50 * 1024 * 1024, compress: bool = False):
+        self.path = os.path.expanduser(path)
+        self.table = table
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.reset_stats()
+        
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                expires REAL,
+                accessed REAL NOT NULL
+            )""")
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed)"
+        )
+        self._conn.commit()
+    
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Stable hash of JSON-serializable key parts"""
+        blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired"""
+        now = time.time()
+        row = self._conn.execute(
+            f"SELECT value, expires FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        
+        if row is None or (row[1] is not None and row[1] <= now):
+            if row is not None:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._conn.commit()
+            self.misses += 1
+            return None
+        
+        self._conn.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+        self.hits += 1
+        value = row[0]
+        if isinstance(value, bytes):
+            value = zlib.decompress(value)
+        return json.loads(value)
+    
+    def put(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store a value, evicting old entries if the cache is over budget"""
+        now = time.time()
+        ttl = ttl if ttl is not None else self.default_ttl
+        blob = json.dumps(value)
+        if self.compress:
+            blob = zlib.compress(blob.encode("utf-8"))
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} "
+            f"(key, value, size, created, expires, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, blob, len(blob), now, now + ttl if ttl is not None else None, now)
+        )
+        self._evict()
+        self._conn.commit()
+    
+    def _evict(self):
+        self._conn.execute(
+            f"DELETE FROM {self.table} WHERE expires IS NOT NULL AND expires <= ?",
+            (time.time(),)
+        )
+        total = self._conn.execute(
+            f"SELECT COALESCE(SUM(size), 0) FROM {self.table}"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        
+        # Walk entries from least to most recently used until under budget
+        doomed = []
+        for key, size in self._conn.execute(
+            f"SELECT key, size FROM {self.table} ORDER BY accessed ASC"
+        ):
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", doomed)
+    
+    def reset_stats(self):
+        """Zero the hit/miss counters"""
+        self.hits = 0
+        self.misses = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters plus current entry count and size"""
+        entries, size = self._conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+        ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size
+        }
+    
+    def close(self):
+        self._conn.close()
+
+
+# =============================================================================
+# RECORD / REPLAY
+# =============================================================================
+
+class CassetteMiss(LookupError):
+    """Raised in cassette replay when a request was never recorded"""
+
+
+class Cassette:
+    """
+    Recorded Brave, Moonshot and crawl traffic for offline replay.
+    
+    In "record" mode the clients store every live response together with
+    how long it took (streamed completions also keep their chunk timings,
+    coalesced to `CHUNK_RESOLUTION_S`). `save()` writes them as one
+    gzipped JSON-lines archive. In "replay" mode the clients answer from
+    the archive instead of the network, waiting the recorded time
+    multiplied by `latency_scale` (1: original, 0: no waiting).
+    
+    Requests are matched by kind and key (search parameters, model plus
+    prompt, canonical URL); repeated keys replay in recording order. An LLM
+    prompt that differs from the recording (e.g. sources arrived in another
+    order) falls back to the next unused recording for the same model.
+    """
+    
+    MODES = ("record", "replay")
+    CHUNK_RESOLUTION_S = 0.05
+    
+    def __init__(self, path: str, mode: str = "replay", latency_scale: float = 1.0):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}' (expected one of: {', '.join(self.MODES)})")
+        self.path = os.path.expanduser(path)
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.entries: List[Dict[str, Any]] = []
+        self.stats = Counter()
+        self._by_key: Dict[tuple, List[Dict[str, Any]]] = {}
+        self._used = set()
+        if mode == "replay":
+            self._load()
+    
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+    
+    def _load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("cassette") != 1:
+                raise ValueError(f"{self.path} is not a cassette archive")
+            for line in f:
+                self._add(json.loads(line))
+    
+    def _add(self, entry: Dict[str, Any]):
+        entry["seq"] = len(self.entries)
+        self.entries.append(entry)
+        self._by_key.setdefault((entry["kind"], entry["key"]), []).append(entry)
+    
+    def record(self, kind: str, key: str, elapsed_s: float, response: Any, group: str = ""):
+        """Store one live response; `group` scopes the fallback match (the LLM model)"""
+        self._add({"kind": kind, "key": key, "group": group,
+                   "elapsed_s": round(elapsed_s, 4), "response": response})
+        self.stats[f"{kind}_recorded"] += 1
+    
+    def lookup(self, kind: str, key: str, group: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Recorded entry for a request. With `group`, an unmatched request
+        takes the next unused entry of that kind and group instead of
+        raising CassetteMiss.
+        """
+        matches = self._by_key.get((kind, key))
+        if matches:
+            entry = next((e for e in matches if e["seq"] not in self._used), matches[-1])
+            self.stats[f"{kind}_replayed"] += 1
+        else:
+            entry = None
+            if group is not None:
+                entry = next((e for e in self.entries if e["kind"] == kind and e["group"] == group
+                              and e["seq"] not in self._used), None)
+            if entry is None:
+                self.stats[f"{kind}_misses"] += 1
+                raise CassetteMiss(f"No recorded {kind} response for {key[:80]}")
+            self.stats[f"{kind}_fallbacks"] += 1
+        self._used.add(entry["seq"])
+        return entry
+    
+    async def play(self, kind: str, key: str, group: Optional[str] = None) -> Any:
+        """Recorded response for a request, after its (scaled) recorded latency"""
+        entry = self.lookup(kind, key, group)
+        if entry["elapsed_s"] > 0 and self.latency_scale > 0:
+            await asyncio.sleep(entry["elapsed_s"] * self.latency_scale)
+        return entry["response"]
+    
+    async def play_chunks(self, entry: Dict[str, Any], on_token: Optional[Callable[[str], None]] = None):
+        """Pass a streamed completion's chunks to `on_token` at their recorded offsets"""
+        start = time.perf_counter()
+        for offset, text in entry["response"].get("chunks", []) + [[entry["elapsed_s"], ""]]:
+            delay = offset * self.latency_scale - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if text and on_token:
+                on_token(text)
+    
+    @classmethod
+    def coalesce(cls, chunks: List[tuple]) -> List[list]:
+        """Merge (offset, text) stream deltas that arrived within CHUNK_RESOLUTION_S"""
+        merged: List[list] = []
+        for offset, text in chunks:
+            if merged and offset - merged[-1][0] < cls.CHUNK_RESOLUTION_S:
+                merged[-1][1] += text
+            else:
+                merged.append([round(offset, 4), text])
+        return merged
+    
+    def save(self):
+        """Write the recorded entries to `path` (atomically replacing it)"""
+        if self.mode != "record":
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            header = {"cassette": 1, "created_at": time.time(),
+                      "counts": dict(Counter(e["kind"] for e in self.entries))}
+            f.write(json.dumps(header) + "\n")
+            for entry in self.entries:
+                f.write(json.dumps({k: v for k, v in entry.items() if k != "seq"},
+                                   separators=(",", ":"), default=str) + "\n")
+        os.replace(tmp, self.path)
+    
+    def report(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "path": self.path, "entries": len(self.entries), **self.stats}
+
+
+# =============================================================================
+# URL CANONICALIZATION & CRAWL FRONTIER
+# =============================================================================
+
+# Query parameters that only track the visitor and never change the page
+TRACKING_PARAMS = frozenset({
+    "gclid", "dclid", "fbclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid",
+    "ref_src", "ref_url", "_ga", "_gl", "spm", "cmpid", "ocid"
+})
+# Plain "ref" selects content on some sites (e.g. a GitHub branch), so it is
+# not dropped
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Canonical form of a URL for deduplication.
+    
+    Lowercases scheme and host, treats http/https and `www.` as the same
+    site, drops default ports, fragments, tracking parameters and trailing
+    slashes, and sorts the remaining query parameters.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port   # ValueError for out-of-range or non-numeric ports
+    except ValueError:
+        return url
+    
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    netloc = host
+    if port and port not in (80, 443):
+        netloc = f"{host}:{port}"
+    
+    path = re.sub(r"/{2,}", "/", parts.path or "/")
+    if len(path) > 1:
+        path = path.rstrip("/")
+    
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    ))
+    return urlunsplit(("https", netloc, path, query, ""))
+
+
+class CrawlFrontier:
+    """
+    Priority queue of URLs to crawl, ordered by reciprocal-rank fusion.
+    
+    Each search result list adds 1 / (k + rank) to the fused score of every
+    URL it contains, keyed by canonical URL. `get()` hands out the highest
+    scoring URL not yet crawled, so a limited crawl budget goes to pages
+    that rank well across many queries. Scores can keep rising while
+    crawling is under way; stale heap entries are skipped lazily.
+    """
+    
+    def __init__(self, max_urls: Optional[int] = None, k: int = 60, warmup: int = 1):
+        self.max_urls = max_urls
+        self.k = k
+        self.warmup = warmup
+        self.scores: Dict[str, float] = {}
+        self.urls: Dict[str, str] = {}          # canonical -> first-seen original URL
+        self.skipped = set()
+        self.dispatched = set()
+        self._heap = []
+        self._lists = 0
+        self._closed = False
+        self._changed = asyncio.Condition()
+    
+    async def add_results(self, results: List[Dict[str, Any]],
+                          skip_result: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                          weight: float = 1.0):
+        """Fuse one ranked search result list (scores scaled by `weight`) into the frontier"""
+        for rank, result in enumerate(results, 1):
+            url = result.get("url")
+            if not url:
+                continue
+            canonical = canonicalize_url(url)
+            if canonical not in self.urls:
+                self.urls[canonical] = url
+                self.scores[canonical] = 0.0
+                if skip_result is not None and skip_result(result):
+                    self.skipped.add(canonical)
+            self.scores[canonical] += weight / (self.k + rank)
+            if canonical not in self.skipped and canonical not in self.dispatched:
+                heapq.heappush(self._heap, (-self.scores[canonical], len(self.urls), canonical))
+        
+        async with self._changed:
+            self._lists += 1
+            self._changed.notify_all()
+    
+    async def close(self):
+        """Signal that no more result lists will arrive"""
+        async with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+    
+    def _budget_left(self) -> bool:
+        return self.max_urls is None or len(self.dispatched) < self.max_urls
+    
+    async def get(self) -> Optional[str]:
+        """Next URL to crawl, or None once the frontier is exhausted"""
+        async with self._changed:
+            while True:
+                if not self._budget_left():
+                    return None
+                
+                if self._lists >= self.warmup or self._closed:
+                    while self._heap:
+                        _, _, canonical = heapq.heappop(self._heap)
+                        if canonical not in self.dispatched:
+                            self.dispatched.add(canonical)
+                            return self.urls[canonical]
+                
+                if self._closed:
+                    return None
+                await self._changed.wait()
+    
+    def ranked_urls(self) -> List[str]:
+        """All unique URLs (original form), best fused score first"""
+        order = sorted(self.scores, key=lambda c: -self.scores[c])
+        return [self.urls[c] for c in order]
+
+
 # =============================================================================
 # BRAVE SEARCH MODULE
 # =============================================================================
@@ -59,99 +1032,244 @@ class BraveSearchClient:
     
     BASE_URL = "https://api.search.brave.com/res/v1/web/search"
     
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        base_url: Optional[str] = None,
+        pool_limit: int = 100,
+        pool_limit_per_host: int = 10,
+        dns_cache_ttl: int = 300,
+        keepalive_timeout: float = 30.0,
+        rate_limiter: Optional[TokenBucket] = None,
+        max_concurrent: int = 5,
+        max_retries: int = 2,
+        cache: Optional[SQLiteCache] = None,
+        cassette: Optional[Cassette] = None
+    ):
         self.api_key = api_key
+        self.base_url = base_url or self.BASE_URL
         self.headers = {
             "Accept": "application/json",
             "Accept-Encoding": "gzip",
             "X-Subscription-Token": api_key
         }
+        
+        # One pooled session for the client's lifetime (created lazily
+        # so the client can be constructed outside a running event loop)
+        self.pool_limit = pool_limit
+        self.pool_limit_per_host = pool_limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        
+        # Shared across all searches made through this client
+        self.rate_limiter = rate_limiter or TokenBucket(BRAVE_RATE_TIERS["free"])
+        self.max_concurrent = max_concurrent
+        self.max_retries = max_retries
+        self.cache = cache
+        self.cassette = cassette   # Records live responses, or replays instead of calling Brave
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_limit,
+                limit_per_host=self.pool_limit_per_host,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers
+            )
+        return self._session
+    
+    async def close(self):
+        """Close the pooled session and release its connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+    
+    async def __aenter__(self) -> "BraveSearchClient":
+        self._get_session()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
     
     async def search(self, query: str, count: int = 10) -> List[Dict[str, Any]]:
         """
         Search using Brave Search API
         Returns list of results with title, url, description
         """
-        params = {
-            "q": query,
-            "count": min(count, 20),  # Brave max is 20
-            "offset": 0,
-            "mkt": "en-US",
-            "safesearch": "moderate",
-            "freshness": "all",
-            "text_decorations": "0",
-            "text_snippets": "1"
-        }
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                self.BASE_URL, 
-                headers=self.headers, 
-                params=params
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"Brave Search failed: {response.status} - {error_text}")
-                
-                data = await response.json()
-                
-                # Extract web results
-                results = []
-                web_results = data.get("web", {}).get("results", [])
-                
-                for result in web_results:
-                    results.append({
-                        "title": result.get("title", ""),
-                        "url": result.get("url", ""),
-                        "description": result.get("description", ""),
-                        "age": result.get("age", "")
-                    })
-                
+        with trace_span("search", query) as span:
+            params = {
+                "q": query,
+                "count": min(count, 20),  # Brave max is 20
+                "offset": 0,
+                "mkt": "en-US",
+                "safesearch": "moderate",
+                "freshness": "all",
+                "text_decorations": "0",
+                "text_snippets": "1"
+            }
+            
+            # Cached results cost neither quota nor a rate-limit token
+            cache_key = None
+            if self.cache is not None:
+                normalized = " ".join(query.lower().split())
+                cache_key = SQLiteCache.make_key(normalized, {k: v for k, v in params.items() if k != "q"})
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    span.set(outcome="cache_hit", results=len(cached))
+                    return cached
+            
+            cassette_key = SQLiteCache.make_key(params) if self.cassette is not None else None
+            if self.cassette is not None and self.cassette.replaying:
+                await self.rate_limiter.acquire()
+                results = await self.cassette.play("search", cassette_key)
+                span.set(outcome="replayed", results=len(results))
                 return results
+            
+            session = self._get_session()
+            for attempt in range(self.max_retries + 1):
+                await self.rate_limiter.acquire()
+                request_start = time.perf_counter()
+                async with session.get(self.base_url, params=params) as response:
+                    self.rate_limiter.update_from_headers(response.headers)
+                    
+                    # Rate limited: the limiter is now blocked per Retry-After, so retry
+                    if response.status == 429 and attempt < self.max_retries:
+                        if "Retry-After" not in response.headers:
+                            self.rate_limiter.block_for(1.0)
+                        continue
+                    
+                    if response.status != 200:
+                        error_text = await response.text()
+                        raise Exception(f"Brave Search failed: {response.status} - {error_text}")
+                    
+                    body = await response.read()
+                    data = json.loads(body)
+                    span.set(bytes=len(body), attempts=attempt + 1)
+                    break
+            
+            # Extract web results
+            results = []
+            web_results = data.get("web", {}).get("results", [])
+            
+            for result in web_results:
+                results.append({
+                    "title": result.get("title", ""),
+                    "url": result.get("url", ""),
+                    "description": result.get("description", ""),
+                    "age": result.get("age", "")
+                })
+            
+            span.set(results=len(results))
+            if cache_key is not None:
+                self.cache.put(cache_key, results)
+            if self.cassette is not None:
+                self.cassette.record("search", cassette_key, time.perf_counter() - request_start, results)
+            
+            return results
     
     async def search_multiple(self, queries: List[str]) -> List[str]:
-        """Search multiple queries and aggregate unique URLs"""
-        all_urls = []
-        
-        for i, query in enumerate(queries):
-            try:
-                # Rate limit: 1 req/sec on free tier
-                if i > 0:
-                    await asyncio.sleep(1.1)
-                results = await self.search(query, count=10)
-                urls = [r["url"] for r in results if r["url"]]
-                all_urls.extend(urls)
-            except Exception as e:
-                print(f"   ⚠️  Search failed for '{query[:30]}...': {e}")
-                continue
+        """
+        Search multiple queries concurrently and aggregate unique URLs,
+        deduplicated by canonical URL and ordered by reciprocal-rank fusion
+        """
+        frontier = CrawlFrontier()
+        await self.search_to_frontier(queries, frontier)
+        return frontier.ranked_urls()
+    
+    async def search_to_frontier(
+        self,
+        queries: List[str],
+        frontier: CrawlFrontier,
+        skip_result: Optional[Callable[[Dict[str, Any]], bool]] = None,
+        weights: Optional[Dict[str, float]] = None
+    ):
+        """
+        Search queries concurrently, fusing each result list into `frontier`
+        as soon as its search returns, then close the frontier. Results for
+        which `skip_result` returns True are recorded but never crawled;
+        `weights` scales the fused scores of a query's results.
+        """
+        # The token bucket paces requests to the plan's rate; the semaphore
+        # caps how many are in flight at once
+        semaphore = asyncio.Semaphore(self.max_concurrent)
         
-        # Remove duplicates while preserving order
-        seen = set()
-        unique_urls = []
-        for url in all_urls:
-            if url and url not in seen:
-                seen.add(url)
-                unique_urls.append(url)
+        async def search_and_add(query: str):
+            async with semaphore:
+                try:
+                    results = await self.search(query, count=10)
+                except Exception as e:
+                    print(f"   ⚠️  Search failed for '{query[:30]}...': {e}")
+                    results = []
+            await frontier.add_results(results, skip_result=skip_result,
+                                       weight=(weights or {}).get(query, 1.0))
         
-        return unique_urls
+        try:
+            await asyncio.gather(*[search_and_add(q) for q in queries])
+        finally:
+            await frontier.close()
 
 
 # =============================================================================
 # MOONSHOT LLM PROVIDER
 # =============================================================================
 
+class ReplayCacheMiss(LookupError):
+    """Raised in replay mode when a prompt has no cached response"""
+
+
 class MoonshotProvider:
-    """Moonshot/Kimi API provider - OpenAI-compatible"""
+    """
+    Moonshot/Kimi API provider - OpenAI-compatible
+    
+    With a `cache`, identical (model, temperature, prompt) requests are
+    served from disk. In `replay` mode the cache is read-only and the API
+    is never called: a miss raises ReplayCacheMiss, which makes runs
+    deterministic for offline benchmarks and tests.
+    """
     
-    def __init__(self, api_key: str):
+    # Some models (like k2.5) only support temperature=1
+    MODELS_NO_TEMP = ["kimi-k2.5"]
+    
+    BASE_URL = "https://api.moonshot.ai/v1"
+    
+    def __init__(self, api_key: Optional[str], cache: Optional[SQLiteCache] = None,
+                 replay: bool = False, limiter=None, base_url: Optional[str] = None,
+                 cassette: Optional[Cassette] = None):
+        if replay and cache is None:
+            raise ValueError("Replay mode requires an LLM cache")
+        
         self.client = AsyncOpenAI(
-            api_key=api_key,
-            base_url="https://api.moonshot.ai/v1"
+            api_key=api_key or "replay-only",
+            base_url=base_url or self.BASE_URL
         )
+        self.cache = cache
+        self.replay = replay
+        # Optional async context manager bounding concurrent API calls
+        # (shared across worker processes by the job queue)
+        self.limiter = limiter
+        self.cassette = cassette   # Records live completions, or replays instead of calling Moonshot
+        self.reset_usage()
+    
+    def reset_usage(self):
+        """Start a fresh usage tally (one per research run)"""
         self.token_usage = {
             "input_tokens": 0,
             "output_tokens": 0,
-            "cost_usd": 0.0
+            "cost_usd": 0.0,
+            "cache_hits": 0,
+            "cached_input_tokens": 0,
+            "cached_output_tokens": 0,
+            "cached_cost_usd_saved": 0.0
         }
     
     def _calculate_cost(self, model: str, input_tokens: int, output_tokens: int) -> float:
@@ -172,30 +1290,175 @@ class MoonshotProvider:
         self, 
         prompt: str, 
         model: str = "kimi-k2-0905-preview",
-        temperature: float = 0.3
+        temperature: float = 0.3,
+        stream: bool = False,
+        on_token: Optional[Callable[[str], None]] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+        validate: Optional[Callable[[str], Any]] = None
     ) -> str:
-        """Generate text using Moonshot API"""
-        # Some models (like k2.5) only support temperature=1
-        models_no_temp = ["kimi-k2.5"]
+        """
+        Generate text using Moonshot API
         
-        kwargs = {
-            "model": model,
-            "messages": [{"role": "user", "content": prompt}]
-        }
-        if model not in models_no_temp:
-            kwargs["temperature"] = temperature
+        With `stream=True` the completion is streamed and each text delta is
+        passed to `on_token` as it arrives; the full text is still returned.
+        `response_format` is passed through (e.g. a JSON schema). Responses
+        for which `validate` raises are neither cached nor served from cache.
+        """
+        with trace_span("llm", model, stream=stream) as span:
+            kwargs = {
+                "model": model,
+                "messages": [{"role": "user", "content": prompt}]
+            }
+            if model not in self.MODELS_NO_TEMP:
+                kwargs["temperature"] = temperature
+            if response_format is not None:
+                kwargs["response_format"] = response_format
+            
+            cache_key = None
+            if self.cache is not None:
+                prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+                cache_key = SQLiteCache.make_key(
+                    model, kwargs.get("temperature"), prompt_hash,
+                    *([response_format] if response_format is not None else [])
+                )
+                cached = self.cache.get(cache_key)
+                if cached is not None and not self._valid(validate, cached["content"]):
+                    cached = None
+                if cached is not None:
+                    span.set(outcome="cache_hit")
+                    self._record_cache_hit(model, cached)
+                    if stream and on_token:
+                        on_token(cached["content"])
+                    return cached["content"]
+                if self.replay:
+                    raise ReplayCacheMiss(
+                        f"No cached response for {model} prompt {prompt_hash[:12]} (replay mode)"
+                    )
+            
+            if self.cassette is not None and self.cassette.replaying:
+                content, input_tokens, output_tokens = await self._replay(kwargs, stream, on_token)
+                span.set(outcome="replayed")
+            else:
+                content, input_tokens, output_tokens = await self._call(kwargs, stream, on_token)
+            
+            # Track usage
+            span.set(input_tokens=input_tokens, output_tokens=output_tokens)
+            self.token_usage["input_tokens"] += input_tokens
+            self.token_usage["output_tokens"] += output_tokens
+            self.token_usage["cost_usd"] += self._calculate_cost(model, input_tokens, output_tokens)
             
-        response = await self.client.chat.completions.create(**kwargs)
+            if cache_key is not None and self._valid(validate, content):
+                self.cache.put(cache_key, {
+                    "content": content,
+                    "input_tokens": input_tokens,
+                    "output_tokens": output_tokens
+                })
+            
+            return content
+    
+    @staticmethod
+    def _valid(validate: Optional[Callable[[str], Any]], content: str) -> bool:
+        if validate is None:
+            return True
+        try:
+            validate(content)
+        except Exception:
+            return False
+        return True
+    
+    async def _call(self, kwargs: Dict[str, Any], stream: bool,
+                    on_token: Optional[Callable[[str], None]]):
+        """Live API call, recorded to the cassette if there is one"""
+        start = time.perf_counter()
+        chunks = []
+        if stream and self.cassette is not None:
+            user_on_token = on_token
+            
+            def on_token(delta: str):
+                chunks.append((time.perf_counter() - start, delta))
+                if user_on_token:
+                    user_on_token(delta)
+        
+        async with self.limiter or contextlib.nullcontext():
+            if stream:
+                content, input_tokens, output_tokens = await self._generate_stream(kwargs, on_token)
+            else:
+                response = await self.client.chat.completions.create(**kwargs)
+                content = response.choices[0].message.content
+                usage = response.usage
+                input_tokens = usage.prompt_tokens if usage else 0
+                output_tokens = usage.completion_tokens if usage else 0
         
-        # Track usage
-        usage = response.usage
-        if usage:
-            self.token_usage["input_tokens"] += usage.prompt_tokens
-            self.token_usage["output_tokens"] += usage.completion_tokens
-            cost = self._calculate_cost(model, usage.prompt_tokens, usage.completion_tokens)
-            self.token_usage["cost_usd"] += cost
+        if self.cassette is not None:
+            recorded = {"content": content, "input_tokens": input_tokens, "output_tokens": output_tokens}
+            if stream:
+                recorded["chunks"] = Cassette.coalesce(chunks)
+            self.cassette.record("llm", SQLiteCache.make_key(kwargs), time.perf_counter() - start,
+                                 recorded, group=kwargs["model"])
+        return content, input_tokens, output_tokens
+    
+    async def _replay(self, kwargs: Dict[str, Any], stream: bool,
+                      on_token: Optional[Callable[[str], None]]):
+        """Completion from the cassette, paced like the recorded call"""
+        entry = self.cassette.lookup("llm", SQLiteCache.make_key(kwargs), group=kwargs["model"])
+        recorded = entry["response"]
+        if recorded.get("chunks"):
+            annotate(ttft_s=recorded["chunks"][0][0] * self.cassette.latency_scale)
+        await self.cassette.play_chunks(entry, on_token if stream else None)
+        if stream and on_token and not recorded.get("chunks"):
+            on_token(recorded["content"])
+        return recorded["content"], recorded["input_tokens"], recorded["output_tokens"]
+    
+    async def _generate_stream(self, kwargs: Dict[str, Any],
+                               on_token: Optional[Callable[[str], None]]):
+        """Stream a completion, returning (text, input_tokens, output_tokens)"""
+        response = await self.client.chat.completions.create(
+            **kwargs,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        
+        parts = []
+        input_tokens = output_tokens = 0
+        start = time.perf_counter()
+        async for chunk in response:
+            # OpenAI puts usage on the final chunk; Moonshot puts it on the
+            # final chunk's choice
+            usage = getattr(chunk, "usage", None)
+            for choice in chunk.choices:
+                usage = usage or getattr(choice, "usage", None)
+                delta = choice.delta.content if choice.delta else None
+                if delta:
+                    if not parts:
+                        annotate(ttft_s=time.perf_counter() - start)
+                    parts.append(delta)
+                    if on_token:
+                        on_token(delta)
+            
+            if usage:
+                if isinstance(usage, dict):
+                    input_tokens = usage.get("prompt_tokens", 0)
+                    output_tokens = usage.get("completion_tokens", 0)
+                else:
+                    input_tokens = usage.prompt_tokens
+                    output_tokens = usage.completion_tokens
         
-        return response.choices[0].message.content
+        return "".join(parts), input_tokens, output_tokens
+    
+    def _record_cache_hit(self, model: str, cached: Dict[str, Any]):
+        """Count tokens (and cost) a cache hit saved us"""
+        self.token_usage["cache_hits"] += 1
+        self.token_usage["cached_input_tokens"] += cached["input_tokens"]
+        self.token_usage["cached_output_tokens"] += cached["output_tokens"]
+        self.token_usage["cached_cost_usd_saved"] += self._calculate_cost(
+            model, cached["input_tokens"], cached["output_tokens"]
+        )
+    
+    def close(self):
+        """Close the response cache"""
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
     
     def get_usage_report(self) -> Dict[str, Any]:
         """Get token usage and cost report"""
@@ -206,9 +1469,125 @@ class MoonshotProvider:
 # RESEARCH MODULES
 # =============================================================================
 
+# JSON schema of the structured planning response (see QueryAnalyzer.plan)
+PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "sub_topics": {"type": "array", "items": {"type": "string"}},
+        "queries": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string"},
+                    "priority": {"type": "integer", "enum": [1, 2, 3]}
+                },
+                "required": ["query", "priority"],
+                "additionalProperties": False
+            }
+        },
+        "source_types": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["sub_topics", "queries", "source_types"],
+    "additionalProperties": False
+}
+
+
+@dataclass
+class ResearchPlan:
+    """Sub-topics, prioritized search queries and expected source types"""
+    queries: List[Dict[str, Any]]                # {"query": str, "priority": 1 (high) .. 3 (low)}
+    sub_topics: List[str] = field(default_factory=list)
+    source_types: List[str] = field(default_factory=list)
+    fallback: bool = False                       # Built from the plain keyword list
+    
+    # Rank-fusion weight of a query's results by its priority
+    PRIORITY_WEIGHTS = {1: 1.5, 2: 1.0, 3: 0.6}
+    
+    @classmethod
+    def from_keywords(cls, keywords: List[str], fallback: bool = False) -> "ResearchPlan":
+        return cls([{"query": k, "priority": 2} for k in keywords], fallback=fallback)
+    
+    @property
+    def keywords(self) -> List[str]:
+        """Queries, highest priority first"""
+        return [q["query"] for q in sorted(self.queries, key=lambda q: q["priority"])]
+    
+    def weights(self) -> Dict[str, float]:
+        return {q["query"]: self.PRIORITY_WEIGHTS[q["priority"]] for q in self.queries}
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "sub_topics": self.sub_topics,
+            "queries": self.queries,
+            "source_types": self.source_types,
+            "fallback": self.fallback
+        }
+
+
+def parse_plan(text: str, count: int) -> ResearchPlan:
+    """
+    Parse a planning response into a ResearchPlan.
+    
+    Tolerates markdown fences and prose around the JSON object (the first
+    object with a "queries" list is used), string or out-of-range
+    priorities and bare-string queries; duplicate queries are dropped and
+    at most `count` kept. Raises ValueError if no query survives.
+    """
+    decoder = json.JSONDecoder()
+    data = None
+    start = text.find("{")
+    while start >= 0:
+        try:
+            candidate, _ = decoder.raw_decode(text, start)
+        except ValueError:
+            candidate = None
+        if isinstance(candidate, dict) and isinstance(candidate.get("queries"), list):
+            data = candidate
+            break
+        start = text.find("{", start + 1)
+    if data is None:
+        raise ValueError("no JSON object with a 'queries' list in planning response")
+    
+    def strings(value) -> List[str]:
+        if not isinstance(value, list):
+            return []
+        return [" ".join(str(v).split()) for v in value if isinstance(v, (str, int, float)) and str(v).strip()]
+    
+    queries, seen = [], set()
+    for item in data["queries"]:
+        if isinstance(item, str):
+            item = {"query": item}
+        if not isinstance(item, dict):
+            continue
+        query = " ".join(str(item.get("query", "")).split())
+        if not query or query.lower() in seen:
+            continue
+        try:
+            priority = min(3, max(1, int(item.get("priority", 2))))
+        except (TypeError, ValueError):
+            priority = 2
+        seen.add(query.lower())
+        queries.append({"query": query, "priority": priority})
+    if not queries:
+        raise ValueError("planning response has no search queries")
+    
+    return ResearchPlan(
+        queries=queries[:count],
+        sub_topics=strings(data.get("sub_topics")),
+        source_types=strings(data.get("source_types"))
+    )
+
+
 class QueryAnalyzer:
     """Analyzes research queries and generates search keywords"""
     
+    PLANNING_MODES = ("structured", "keywords")
+    PLAN_FORMATS = (
+        {"type": "json_object"},
+        {"type": "json_schema", "json_schema": {"name": "research_plan", "strict": True, "schema": PLAN_SCHEMA}}
+    )
+    
     def __init__(self, llm: MoonshotProvider, model: str):
         self.llm = llm
         self.model = model
@@ -245,36 +1624,546 @@ Return ONLY the search queries, one per line. No numbering, no explanations."""
         response = await self.llm.generate(prompt, model=self.model)
         keywords = [k.strip() for k in response.strip().split('\n') if k.strip()]
         return keywords[:count]
+    
+    async def plan(self, query: str, count: int = 10) -> ResearchPlan:
+        """
+        Sub-topics, prioritized search queries and source types in one
+        JSON-mode call (retried once in strict schema mode). If neither
+        response parses, falls back to `generate_keywords` (all queries
+        priority 2).
+        """
+        prompt = f"""Plan web research for this topic.
+
+Research Topic: "{query}"
+
+Return a JSON object with:
+- "sub_topics": the 3-5 key sub-topics to cover
+- "queries": {count} diverse web search queries covering different angles, time periods and
+  specificity levels, each as {{"query": "...", "priority": 1|2|3}} (1 = most important)
+- "source_types": the kinds of sources likely to answer it (e.g. "academic papers",
+  "news", "official documentation", "industry reports")
+
+Return ONLY the JSON object."""
+        
+        # Moonshot's documented JSON mode first (the prompt describes the
+        # shape), then strict schema mode for endpoints that support it
+        for response_format in self.PLAN_FORMATS:
+            try:
+                # An unparseable plan isn't cached, so later runs ask again
+                response = await self.llm.generate(
+                    prompt, model=self.model, response_format=response_format,
+                    validate=lambda response: parse_plan(response, count)
+                )
+                return parse_plan(response, count)
+            except Exception as e:
+                print(f"   ⚠️  Structured plan failed with {response_format['type']} "
+                      f"({type(e).__name__}: {e})")
+        print("   ⚠️  Generating a plain query list instead")
+        return ResearchPlan.from_keywords(await self.generate_keywords(query, count), fallback=True)
+
+
+@dataclass
+class ResourceProfile:
+    """Which browser sub-requests to block while rendering a page"""
+    name: str
+    blocked_types: frozenset = frozenset()        # Playwright resource types
+    blocked_domains: frozenset = frozenset()      # Blocked along with their subdomains
+    block_third_party_scripts: bool = False
+    disable_media: bool = False                   # No autoplay, muted audio
+
+
+# Ad, analytics and tracking hosts that never contribute page text
+AD_TRACKER_DOMAINS = frozenset({
+    "doubleclick.net", "googlesyndication.com", "googleadservices.com",
+    "googletagmanager.com", "googletagservices.com", "google-analytics.com",
+    "adservice.google.com", "amazon-adsystem.com", "adnxs.com", "criteo.com",
+    "taboola.com", "outbrain.com", "scorecardresearch.com", "quantserve.com",
+    "facebook.net", "hotjar.com", "segment.io", "chartbeat.com", "optimizely.com",
+    "nr-data.net", "moatads.com", "pubmatic.com", "rubiconproject.com"
+})
+
+RESOURCE_PROFILES = {
+    "off": ResourceProfile("off"),
+    "lean": ResourceProfile(
+        "lean",
+        blocked_types=frozenset({"image", "media", "font"}),
+        blocked_domains=AD_TRACKER_DOMAINS,
+        disable_media=True
+    ),
+    "strict": ResourceProfile(
+        "strict",
+        blocked_types=frozenset({"image", "media", "font", "stylesheet", "texttrack", "manifest"}),
+        blocked_domains=AD_TRACKER_DOMAINS,
+        block_third_party_scripts=True,
+        disable_media=True
+    ),
+}
+
+
+class ResourceBlocker:
+    """
+    Browser request interception for a ResourceProfile.
+    
+    Installed as a Crawl4AI `before_goto` hook, it routes every sub-request
+    of the page through the profile and records per-page counts of blocked
+    requests and bytes actually transferred, which `pop_stats` hands back
+    after the crawl.
+    """
+    
+    def __init__(self, profile: ResourceProfile, extra_domains: Optional[List[str]] = None):
+        self.profile = profile
+        self.blocked_domains = frozenset(profile.blocked_domains) | frozenset(extra_domains or ())
+        self._stats: Dict[str, Dict[str, Any]] = {}
+    
+    @property
+    def active(self) -> bool:
+        return bool(
+            self.profile.blocked_types or self.blocked_domains
+            or self.profile.block_third_party_scripts
+        )
+    
+    def _site(self, host: str) -> str:
+        """Crude registrable domain: last two labels"""
+        return ".".join(host.split(".")[-2:])
+    
+    def _domain_blocked(self, host: str) -> bool:
+        parts = host.split(".")
+        return any(".".join(parts[i:]) in self.blocked_domains for i in range(len(parts) - 1))
+    
+    def should_block(self, page_host: str, request_url: str, resource_type: str) -> bool:
+        if resource_type == "document":
+            return False
+        if resource_type in self.profile.blocked_types:
+            return True
+        host = (urlsplit(request_url).hostname or "").lower()
+        if self._domain_blocked(host):
+            return True
+        return (
+            self.profile.block_third_party_scripts
+            and resource_type == "script"
+            and self._site(host) != self._site(page_host)
+        )
+    
+    async def before_goto(self, page, context=None, url: str = "", **kwargs):
+        """Crawl4AI hook: route the page's requests before navigation"""
+        stats = {"blocked_requests": 0, "blocked_by_type": {}, "allowed_requests": 0, "bytes": 0}
+        self._stats[url] = stats
+        page_host = (urlsplit(url).hostname or "").lower()
+        
+        async def handle(route):
+            request = route.request
+            if self.should_block(page_host, request.url, request.resource_type):
+                stats["blocked_requests"] += 1
+                by_type = stats["blocked_by_type"]
+                by_type[request.resource_type] = by_type.get(request.resource_type, 0) + 1
+                await route.abort()
+            else:
+                stats["allowed_requests"] += 1
+                await route.continue_()
+        
+        def on_response(response):
+            length = response.headers.get("content-length")
+            if length and length.isdigit():
+                stats["bytes"] += int(length)
+        
+        if self.active:
+            await page.route("**/*", handle)
+        page.on("response", on_response)
+        return page
+    
+    def pop_stats(self, url: str) -> Optional[Dict[str, Any]]:
+        return self._stats.pop(url, None)
+
+
+# Markers of client-rendered apps whose server HTML is an empty shell
+JS_APP_MARKERS = (
+    'id="root"></div>', 'id="app"></div>', 'id="__next"></div>', "window.__NUXT__",
+    "ng-app", "data-reactroot", "enable javascript", "requires javascript"
+)
+
+
+def html_to_markdown(html: str, url: str) -> Dict[str, str]:
+    """
+    Crawl4AI markdown generation + pruning on raw HTML (no browser)
+    
+    Returns the page title, fit (pruned) markdown and raw markdown.
+    """
+    md_generator = DefaultMarkdownGenerator(
+        content_filter=PruningContentFilter(threshold=0.4, threshold_type="fixed")
+    )
+    markdown = md_generator.generate_markdown(html, base_url=url)
+    title_match = re.search(r"<title[^>]*>(.*?)</title>", html, re.IGNORECASE | re.DOTALL)
+    return {
+        'title': " ".join(title_match.group(1).split()) if title_match else 'Unknown',
+        'content': markdown.fit_markdown or "",
+        'raw_markdown': markdown.raw_markdown or ""
+    }
+
+
+class PageSpool:
+    """
+    Append-only, compressed on-disk store for crawled page text.
+    
+    Each page is zlib-compressed into an anonymous temporary file (already
+    unlinked, so it disappears with the process) and read back through an
+    mmap, leaving only compact SpooledPage handles in memory.
+    """
+    
+    def __init__(self, directory: Optional[str] = None, level: int = 6):
+        self.level = level
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._map: Optional[mmap.mmap] = None
+        self._size = 0
+        self.pages = 0
+        self.raw_bytes = 0
+    
+    def add(self, page: dict) -> "SpooledPage":
+        raw = (page.get('content') or "").encode("utf-8")
+        blob = zlib.compress(raw, self.level)
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(blob)
+        offset = self._size
+        self._size += len(blob)
+        self.pages += 1
+        self.raw_bytes += len(raw)
+        return SpooledPage(self, page['url'], page.get('title', ''), offset, len(blob))
+    
+    def read(self, offset: int, length: int) -> str:
+        if self._map is None or len(self._map) < offset + length:
+            # The spool grew since it was last mapped
+            self._file.flush()
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), self._size, access=mmap.ACCESS_READ)
+        return zlib.decompress(self._map[offset:offset + length]).decode("utf-8")
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"pages": self.pages, "raw_bytes": self.raw_bytes, "stored_bytes": self._size}
+    
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+class SpooledPage(Mapping):
+    """
+    Read-only crawl result whose 'content' stays in a PageSpool until used.
+    
+    Behaves like the page dicts the crawler returns ('url', 'title',
+    'content', 'success'), so the rest of the pipeline doesn't care where
+    the text lives.
+    """
+    
+    __slots__ = ("spool", "url", "title", "_offset", "_length")
+    KEYS = ("url", "title", "content", "success")
+    
+    def __init__(self, spool: PageSpool, url: str, title: str, offset: int, length: int):
+        self.spool = spool
+        self.url = url
+        self.title = title
+        self._offset = offset
+        self._length = length
+    
+    def __getitem__(self, key: str):
+        if key == "content":
+            return self.spool.read(self._offset, self._length)
+        if key == "url":
+            return self.url
+        if key == "title":
+            return self.title
+        if key == "success":
+            return True
+        raise KeyError(key)
+    
+    def __iter__(self):
+        return iter(self.KEYS)
+    
+    def __len__(self) -> int:
+        return len(self.KEYS)
+    
+    def __repr__(self) -> str:
+        return f"SpooledPage({self.url!r}, {self._length} bytes spooled)"
+
+
+def memory_usage() -> Dict[str, float]:
+    """Current and peak RSS of this process in MB (browser processes not included)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024   # bytes vs KB
+    usage = {"peak_rss_mb": peak_mb}
+    try:
+        with open("/proc/self/statm") as f:
+            usage["rss_mb"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        pass
+    return usage
+
+
+def reset_peak_rss():
+    """Restart the peak RSS high-water mark where the kernel allows it (Linux 4.0+)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _supported_run_options(**options) -> Dict[str, Any]:
+    """
+    The subset of `options` this Crawl4AI version's CrawlerRunConfig
+    accepts. Used for capture switches that are off by default anyway, so
+    on versions that predate one, leaving it out changes nothing.
+    """
+    accepted = inspect.signature(CrawlerRunConfig.__init__).parameters
+    return {name: value for name, value in options.items() if name in accepted}
+
+
+class _DeferredMarkdown(MarkdownGenerationStrategy):
+    """Skips Crawl4AI's in-loop markdown step; the crawler converts the HTML itself"""
+    
+    def generate_markdown(self, input_html: str, *args, **kwargs) -> MarkdownGenerationResult:
+        return MarkdownGenerationResult(
+            raw_markdown="", markdown_with_citations="", references_markdown=""
+        )
 
 
 class ContentCrawler:
-    """Crawls URLs and extracts content using Crawl4AI"""
+    """
+    Crawls URLs and extracts content using Crawl4AI
+    
+    Pages are fetched in tiers. In "auto" mode a plain pooled HTTP GET is
+    tried first and its HTML converted to markdown in-process; only pages
+    that look JS-dependent (too little text, or client-side framework
+    markers) are rendered in headless Chromium. "browser" mode always
+    renders.
+    
+    With a `cache`, pages are stored by canonical URL as compressed
+    fit-markdown plus their ETag/Last-Modified validators. Entries younger
+    than `cache_fresh_s` are served as-is; older ones send their validators
+    with the live fetch, so a 304 serves the cached copy and a 200 is used
+    as the new page. The browser is launched lazily, on the first page that
+    needs it.
+    
+    HTML->markdown conversion and pruning are CPU-bound. With
+    `markdown_workers` > 0 they run in a process pool (raw HTML in,
+    markdown out) so a heavy page doesn't stall the event loop and every
+    other in-flight crawl and API call with it.
+    """
+    
+    FETCH_MODES = ("auto", "browser")
+    THROTTLE_STATUSES = (429, 503)
+    STATIC_MAX_BYTES = 5 * 1024 * 1024
+    USER_AGENT = (
+        "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+    )
+    
+    def __init__(self, max_concurrent: int = 5, timeout: int = 30,
+                 cache: Optional[SQLiteCache] = None, cache_fresh_s: float = 24 * 3600,
+                 fetch_mode: str = "auto", static_min_words: int = 150,
+                 resource_profile: str = "lean", blocked_domains: Optional[List[str]] = None,
+                 keep_browser: bool = False, limiter=None,
+                 scheduler: Optional[HostScheduler] = None, markdown_workers: int = 0,
+                 max_page_chars: Optional[int] = None, cassette: Optional[Cassette] = None):
+        if resource_profile not in RESOURCE_PROFILES:
+            raise ValueError(
+                f"Unknown resource profile '{resource_profile}' "
+                f"(expected one of: {', '.join(RESOURCE_PROFILES)})"
+            )
+        if fetch_mode not in self.FETCH_MODES:
+            raise ValueError(f"Unknown fetch mode '{fetch_mode}' (expected one of: {', '.join(self.FETCH_MODES)})")
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.cache = cache
+        self.cache_fresh_s = cache_fresh_s
+        self.fetch_mode = fetch_mode
+        self.static_min_words = static_min_words
+        self.blocker = ResourceBlocker(RESOURCE_PROFILES[resource_profile], blocked_domains)
+        self.keep_browser = keep_browser
+        self.limiter = limiter   # Optional async context manager bounding live fetches
+        self.scheduler = scheduler or HostScheduler(
+            AIMDController(max_concurrent, minimum=max_concurrent, maximum=max_concurrent)
+        )
+        self.markdown_workers = markdown_workers
+        self.max_page_chars = max_page_chars
+        self.spool: Optional[PageSpool] = None   # Set per run to spool page text to disk
+        self.cassette = cassette   # Records live fetches, or replays them instead of fetching
+        self.reset_stats()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._warm_browser: Optional[_LazyBrowser] = None
+        self._markdown_pool: Optional[ProcessPoolExecutor] = None
+    
+    def reset_stats(self):
+        """Zero the per-run crawl, cache and browser resource counters"""
+        self.page_metrics: List[Dict[str, Any]] = []
+        self.scheduler.reset_stats()
+        self.cache_counts = {"fresh": 0, "revalidated": 0, "stale": 0, "misses": 0}
+        self.crawl_counts = {
+            "timeouts": 0, "cancelled": 0, "deadline_hits": 0,
+            "static": 0, "browser": 0, "static_fallbacks": 0, "truncated": 0
+        }
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Pooled session for static fetches and conditional revalidation"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.scheduler.controller.maximum * 2,
+                    limit_per_host=max(4, self.scheduler.per_host * 2),
+                    ttl_dns_cache=300
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"User-Agent": self.USER_AGENT}
+            )
+        return self._session
+    
+    async def close(self):
+        """Close the HTTP session, the warm browser, the markdown pool and the crawl cache"""
+        if self._markdown_pool is not None:
+            self._markdown_pool.shutdown(wait=False, cancel_futures=True)
+            self._markdown_pool = None
+        if self._warm_browser is not None:
+            await self._warm_browser.close()
+            self._warm_browser = None
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+    
+    def _cache_entry(self, url: str) -> Optional[dict]:
+        """Crawl cache entry for `url`, fresh or stale, or None on a miss"""
+        if self.cache is None:
+            return None
+        try:
+            entry = self.cache.get(canonicalize_url(url))
+        except sqlite3.Error as e:
+            # e.g. "database is locked" with job workers sharing the cache
+            print(f"   ⚠️  Crawl cache read failed for {url}: {e}")
+            entry = None
+        if entry is None:
+            self.cache_counts["misses"] += 1
+        return entry
     
-    def __init__(self, max_concurrent: int = 5, timeout: int = 30):
-        self.max_concurrent = max_concurrent
-        self.timeout = timeout
+    @staticmethod
+    def _conditional_headers(entry: Optional[dict]) -> Dict[str, str]:
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+    
+    def _revalidated_page(self, url: str, entry: dict) -> dict:
+        """The cached page for a 304, with the entry's freshness restarted"""
+        entry['fetched_at'] = time.time()
+        self._cache_put(url, entry)
+        return {'url': url, 'title': entry['title'], 'content': entry['content'],
+                'success': True, 'revalidated': True}
+    
+    async def _revalidate(self, url: str, entry: dict) -> bool:
+        """Conditional GET (browser mode) - True if the server says the page is unchanged"""
+        headers = self._conditional_headers(entry)
+        if not headers:
+            return False
+        
+        try:
+            # The body is never read: browser mode re-renders a changed page anyway
+            async with self._get_session().get(url, headers=headers) as response:
+                return response.status == 304
+        except asyncio.TimeoutError:
+            raise
+        except Exception:
+            return False
+    
+    def _store(self, url: str, page: dict, response_headers: Optional[dict]):
+        if self.cache is None or not page['success']:
+            return
+        headers = {k.lower(): v for k, v in (response_headers or {}).items()}
+        self._cache_put(url, {
+            'title': page['title'],
+            'content': page['content'],
+            'etag': headers.get('etag'),
+            'last_modified': headers.get('last-modified'),
+            'fetched_at': time.time()
+        })
+    
+    def _cache_put(self, url: str, entry: dict):
+        # A failed write only costs a later re-fetch, never the run
+        try:
+            self.cache.put(canonicalize_url(url), entry)
+        except sqlite3.Error as e:
+            print(f"   ⚠️  Crawl cache write failed for {url}: {e}")
+    
+    def cache_report(self) -> Dict[str, Any]:
+        """Crawl cache hit rates for this crawler's lifetime"""
+        counts = dict(self.cache_counts)
+        lookups = sum(counts.values())
+        hits = counts["fresh"] + counts["revalidated"]
+        counts["hit_rate"] = hits / lookups if lookups else 0.0
+        return counts
     
     async def crawl_single(self, crawler: AsyncWebCrawler, url: str) -> dict:
         """Crawl a single URL"""
         try:
-            # Configure content filter for clean output
-            md_generator = DefaultMarkdownGenerator(
-                content_filter=PruningContentFilter(threshold=0.4, threshold_type="fixed")
-            )
+            # Configure content filter for clean output (deferred to the
+            # process pool when there is one)
+            if self.markdown_workers > 0:
+                md_generator = _DeferredMarkdown()
+            else:
+                md_generator = DefaultMarkdownGenerator(
+                    content_filter=PruningContentFilter(threshold=0.4, threshold_type="fixed")
+                )
             
+            # Caching is handled by ContentCrawler itself, keyed by canonical URL
             run_config = CrawlerRunConfig(
                 markdown_generator=md_generator,
-                cache_mode=True
+                cache_mode=CacheMode.BYPASS,
+                page_timeout=int(self.timeout * 1000),
+                **_supported_run_options(
+                    screenshot=False,
+                    pdf=False,
+                    capture_mhtml=False,     # Crawl4AI 0.6+
+                    wait_for_images=False
+                )
             )
             
-            result = await crawler.arun(url, config=run_config)
+            # page_timeout only covers navigation - enforce the whole deadline here
+            start = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(
+                    crawler.arun(url, config=run_config),
+                    timeout=self.timeout
+                )
+            except asyncio.TimeoutError:
+                return self._timed_out_page(url)
+            finally:
+                page_stats = self.blocker.pop_stats(url)
+                if page_stats is not None:
+                    page_stats.update(url=url, render_s=time.perf_counter() - start)
+                    self.page_metrics.append(page_stats)
+            if not result.success:
+                if result.status_code in self.THROTTLE_STATUSES:
+                    return self._throttled_page(url, result.status_code, result.response_headers)
+                raise Exception(result.error_message or f"HTTP {result.status_code}")
             
-            return {
+            if self.markdown_workers > 0:
+                # Same input Crawl4AI's own generator uses
+                content = (await self.to_markdown(result.cleaned_html or result.html or "", url))['content']
+            else:
+                content = result.markdown.fit_markdown if hasattr(result.markdown, 'fit_markdown') else result.markdown
+            page = {
                 'url': url,
-                'title': result.metadata.get('title', 'Unknown'),
-                'content': result.markdown.fit_markdown if hasattr(result.markdown, 'fit_markdown') else result.markdown,
+                'title': (result.metadata or {}).get('title', 'Unknown'),
+                'content': content,
                 'success': True
             }
+            self._store(url, page, result.response_headers)
+            return page
         except Exception as e:
             return {
                 'url': url,
@@ -283,54 +2172,698 @@ class ContentCrawler:
                 'success': False
             }
     
+    def _browser_config(self) -> BrowserConfig:
+        extra_args = []
+        if self.blocker.profile.disable_media:
+            extra_args = ["--autoplay-policy=user-gesture-required", "--mute-audio"]
+        return BrowserConfig(headless=True, extra_args=extra_args)
+    
+    def _browser(self) -> "_LazyBrowser":
+        """Browser for one crawl, or the long-lived one when `keep_browser` is set"""
+        hooks = {"before_goto": self.blocker.before_goto}
+        if not self.keep_browser:
+            return _LazyBrowser(self._browser_config(), hooks=hooks)
+        if self._warm_browser is None:
+            self._warm_browser = _LazyBrowser(self._browser_config(), hooks=hooks, persistent=True)
+        # Let each crawl retry a launch that failed during an earlier one
+        self._warm_browser.clear_error()
+        return self._warm_browser
+    
+    async def warm_up(self):
+        """Launch the long-lived browser now instead of on the first rendered page"""
+        if not self.keep_browser:
+            raise RuntimeError("warm_up() requires keep_browser=True")
+        await self._browser().get()
+    
+    def resource_report(self) -> Dict[str, Any]:
+        """Totals of the per-page browser resource metrics"""
+        pages = self.page_metrics
+        return {
+            "profile": self.blocker.profile.name,
+            "pages": len(pages),
+            "blocked_requests": sum(p["blocked_requests"] for p in pages),
+            "allowed_requests": sum(p["allowed_requests"] for p in pages),
+            "bytes": sum(p["bytes"] for p in pages),
+            "render_s": sum(p["render_s"] for p in pages),
+            "per_page": pages
+        }
+    
+    def _needs_browser(self, html: str, page: Dict[str, str]) -> bool:
+        """Heuristic: does this server HTML look like it needs JS to render?"""
+        words = len(page['content'].split())
+        if words < self.static_min_words:
+            return True
+        lowered = html.lower()
+        has_markers = any(marker.lower() in lowered for marker in JS_APP_MARKERS)
+        # Server-rendered framework pages still carry plenty of text
+        return has_markers and words < 3 * self.static_min_words
+    
+    async def fetch_static(self, url: str, stale: Optional[dict] = None) -> Optional[dict]:
+        """
+        Tier 1: plain GET plus in-process markdown extraction.
+        
+        With a `stale` cache entry the GET is conditional: a 304 returns the
+        cached page (marked 'revalidated'), a 200 is converted as usual.
+        Returns None when the page should be rendered in the browser instead
+        (non-HTML, error status, oversized or JS-dependent).
+        """
+        conditional = self._conditional_headers(stale)
+        try:
+            async with self._get_session().get(url, headers=conditional) as response:
+                if conditional and response.status == 304:
+                    return self._revalidated_page(url, stale)
+                if response.status in self.THROTTLE_STATUSES:
+                    # The browser would be refused too - back off instead
+                    return self._throttled_page(url, response.status, response.headers)
+                content_type = response.headers.get("Content-Type", "")
+                if response.status != 200 or "html" not in content_type.lower():
+                    return None
+                body = await response.content.read(self.STATIC_MAX_BYTES + 1)
+                if len(body) > self.STATIC_MAX_BYTES:
+                    return None
+                html = body.decode(response.get_encoding() or "utf-8", errors="replace")
+                headers = dict(response.headers)
+        except asyncio.TimeoutError:
+            # A hanging host would hang the browser too - let the caller time out
+            raise
+        except Exception:
+            return None
+        
+        page = await self.to_markdown(html, url)
+        if self._needs_browser(html, page):
+            return None
+        
+        result = {'url': url, 'title': page['title'], 'content': page['content'], 'success': True}
+        self._store(url, result, headers)
+        return result
+    
+    async def to_markdown(self, html: str, url: str) -> Dict[str, str]:
+        """html_to_markdown, in the process pool when `markdown_workers` is set"""
+        if self.markdown_workers <= 0:
+            return html_to_markdown(html, url)
+        if self._markdown_pool is None:
+            # spawn: forking a process that runs an event loop and Playwright is unsafe
+            self._markdown_pool = ProcessPoolExecutor(
+                max_workers=self.markdown_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._markdown_pool, html_to_markdown, html, url
+            )
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM on a huge page): start a fresh pool next time
+            self._markdown_pool = None
+            return html_to_markdown(html, url)
+    
+    def _throttled_page(self, url: str, status: int, headers) -> dict:
+        retry_after = None
+        try:
+            retry_after = float((headers or {}).get("Retry-After", ""))
+        except ValueError:
+            pass
+        return {
+            'url': url,
+            'title': 'Error',
+            'content': f"Failed to crawl: HTTP {status} (throttled)",
+            'success': False,
+            'throttled': True,
+            'retry_after': retry_after
+        }
+    
+    async def _crawl_cached(self, browser: "_LazyBrowser", url: str) -> dict:
+        """
+        Serve from the crawl cache, then the static tier, then the browser.
+        
+        Successful pages are capped at `max_page_chars` and, with a spool,
+        handed back as SpooledPage handles with their text on disk.
+        """
+        with trace_span("crawl", url) as span:
+            entry = self._cache_entry(url)
+            if entry is not None and time.time() - entry['fetched_at'] < self.cache_fresh_s:
+                self.cache_counts["fresh"] += 1
+                span.set(tier="cache")
+                page = {'url': url, 'title': entry['title'], 'content': entry['content'], 'success': True}
+            else:
+                # A stale entry goes along so the live fetch can revalidate it
+                page = await self._fetch_scheduled(browser, url, entry)
+                if entry is not None:
+                    self.cache_counts["revalidated" if page.get('revalidated') else "stale"] += 1
+            if not page['success']:
+                span.set(outcome=(
+                    "throttled" if page.get('throttled')
+                    else "timeout" if page.get('timed_out') else "failed"
+                ))
+                return page
+            
+            span.set(bytes=len(page['content'].encode("utf-8")))
+            if self.max_page_chars and len(page['content']) > self.max_page_chars:
+                page = dict(page, content=page['content'][:self.max_page_chars])
+                self.crawl_counts["truncated"] += 1
+            if self.spool is not None:
+                page = self.spool.add(page)
+            return page
+    
+    async def _fetch_scheduled(self, browser: "_LazyBrowser", url: str,
+                               stale: Optional[dict] = None) -> dict:
+        # Live fetches and revalidations go through the per-host scheduler;
+        # fresh cache hits don't.
+        # A throttled page gets one more try once the host's backoff ends.
+        for attempt in range(2):
+            async with self.scheduler.slot(url) as outcome:
+                async with self.limiter or contextlib.nullcontext():
+                    page = await self._fetch_recorded(browser, url, stale)
+                outcome.update(
+                    ok=page['success'],
+                    throttled=page.get('throttled', False),
+                    timed_out=page.get('timed_out', False),
+                    retry_after=page.get('retry_after')
+                )
+            if not page.get('throttled'):
+                break
+        return page
+    
+    async def _fetch_recorded(self, browser: "_LazyBrowser", url: str,
+                              stale: Optional[dict] = None) -> dict:
+        """_fetch_live, recorded to or replayed from the cassette if there is one"""
+        if self.cassette is None:
+            return await self._fetch_live(browser, url, stale)
+        key = canonicalize_url(url)
+        if self.cassette.replaying:
+            annotate(tier="replay")
+            try:
+                return dict(await self.cassette.play("crawl", key), url=url)
+            except CassetteMiss as e:
+                return {'url': url, 'title': 'Error', 'content': f"Failed to crawl: {e}", 'success': False}
+        start = time.perf_counter()
+        page = await self._fetch_live(browser, url, stale)
+        self.cassette.record("crawl", key, time.perf_counter() - start, page)
+        return page
+    
+    def _timed_out_page(self, url: str) -> dict:
+        self.crawl_counts["timeouts"] += 1
+        return {
+            'url': url,
+            'title': 'Error',
+            'content': f"Failed to crawl: timed out after {self.timeout}s",
+            'success': False,
+            'timed_out': True
+        }
+    
+    async def _fetch_live(self, browser: "_LazyBrowser", url: str,
+                          stale: Optional[dict] = None) -> dict:
+        """All fetch tiers for one URL, within a single `timeout` deadline"""
+        try:
+            return await asyncio.wait_for(self._fetch_tiers(browser, url, stale), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            return self._timed_out_page(url)
+    
+    async def _fetch_tiers(self, browser: "_LazyBrowser", url: str,
+                           stale: Optional[dict] = None) -> dict:
+        if self.fetch_mode == "auto":
+            page = await self.fetch_static(url, stale)
+            if page is not None and page.get('revalidated'):
+                annotate(tier="cache")
+                return page
+            if page is not None:
+                if page['success']:
+                    self.crawl_counts["static"] += 1
+                annotate(tier="static")
+                return page
+            self.crawl_counts["static_fallbacks"] += 1
+        elif stale is not None and await self._revalidate(url, stale):
+            annotate(tier="cache")
+            return self._revalidated_page(url, stale)
+        
+        self.crawl_counts["browser"] += 1
+        annotate(tier="browser")
+        try:
+            crawler = await browser.get()
+        except Exception as e:
+            return {
+                'url': url,
+                'title': 'Error',
+                'content': f"Failed to crawl: browser unavailable ({e})",
+                'success': False
+            }
+        return await self.crawl_single(crawler, url)
+    
     async def crawl_urls(self, urls: List[str], max_urls: int = 20) -> List[dict]:
         """Crawl multiple URLs in parallel"""
         urls = urls[:max_urls]  # Limit URLs
         
-        browser_config = BrowserConfig(headless=True)
+        async with self._browser() as browser:
+            # The host scheduler bounds how many of these fetch at once
+            results = await asyncio.gather(*[self._crawl_cached(browser, url) for url in urls])
         
-        async with AsyncWebCrawler(config=browser_config) as crawler:
-            # Create semaphore to limit concurrent crawls
-            semaphore = asyncio.Semaphore(self.max_concurrent)
-            
-            async def crawl_with_limit(url):
-                async with semaphore:
-                    return await self.crawl_single(crawler, url)
+        # Filter to successful crawls only
+        return [r for r in results if r['success']]
+    
+    async def crawl_frontier(
+        self,
+        frontier: CrawlFrontier,
+        target: Optional[int] = None,
+        deadline: Optional[float] = None
+    ) -> List[dict]:
+        """
+        Crawl URLs from `frontier`, best-ranked first, until it is exhausted.
+        
+        Workers share one browser, so crawling starts on the first URLs
+        without waiting for every search to finish; the host scheduler
+        decides how many of them fetch at once. Crawling stops
+        early, cancelling in-flight pages, once `target` pages have succeeded
+        (hedged over-fetching) or `deadline` seconds have passed; the pages
+        finished by then are returned.
+        """
+        results = []
+        successes = 0
+        enough = asyncio.Event()
+        
+        async with self._browser() as browser:
+            async def worker():
+                nonlocal successes
+                while not enough.is_set():
+                    url = await frontier.get()
+                    if url is None:
+                        return
+                    page = await self._crawl_cached(browser, url)
+                    results.append(page)
+                    if page['success']:
+                        successes += 1
+                        if target is not None and successes >= target:
+                            enough.set()
             
-            # Run all crawls concurrently
-            results = await asyncio.gather(*[crawl_with_limit(url) for url in urls])
+            # One worker per possible slot; the scheduler's limit does the throttling
+            workers = [
+                asyncio.create_task(worker())
+                for _ in range(self.scheduler.controller.maximum)
+            ]
+            all_done = asyncio.gather(*workers)
+            enough_wait = asyncio.create_task(enough.wait())
+            try:
+                done, _ = await asyncio.wait(
+                    [all_done, enough_wait],
+                    timeout=deadline,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    self.crawl_counts["deadline_hits"] += 1
+                    print(f"   ⏱️  Crawl deadline of {deadline}s reached, "
+                          f"keeping {successes} finished pages")
+                if all_done in done:
+                    all_done.result()
+            finally:
+                enough_wait.cancel()
+                in_flight = [w for w in workers if not w.done()]
+                self.crawl_counts["cancelled"] += len(in_flight)
+                for w in in_flight:
+                    w.cancel()
+                await asyncio.gather(all_done, return_exceptions=True)
         
         # Filter to successful crawls only
-        return [r for r in results if r['success']]
+        pages = [r for r in results if r['success']]
+        return pages[:target] if target is not None else pages
 
 
-class SynthesisEngine:
-    """Synthesizes crawled content into a research report"""
+class _LazyBrowser:
+    """
+    Starts one shared AsyncWebCrawler on first use, closes it on exit.
     
-    def __init__(self, llm: MoonshotProvider, model: str):
-        self.llm = llm
-        self.model = model
+    A `persistent` browser outlives the `async with` block and is only shut
+    down by `close()`, so consecutive crawls reuse the running Chromium.
+    """
+    
+    def __init__(self, config: BrowserConfig, hooks: Optional[Dict[str, Callable]] = None,
+                 persistent: bool = False):
+        self.config = config
+        self.hooks = hooks or {}
+        self.persistent = persistent
+        self._crawler: Optional[AsyncWebCrawler] = None
+        self._error: Optional[Exception] = None
+        self._lock = asyncio.Lock()
+    
+    async def get(self) -> AsyncWebCrawler:
+        async with self._lock:
+            # A failed launch is remembered rather than retried by every worker
+            if self._error is not None:
+                raise self._error
+            if self._crawler is None:
+                crawler = AsyncWebCrawler(config=self.config)
+                for hook_type, hook in self.hooks.items():
+                    crawler.crawler_strategy.set_hook(hook_type, hook)
+                try:
+                    await crawler.start()
+                except Exception as e:
+                    # Don't leak the Playwright driver if Chromium fails to launch
+                    await crawler.close()
+                    self._error = e
+                    raise
+                self._crawler = crawler
+        return self._crawler
+    
+    def clear_error(self):
+        self._error = None
+    
+    async def close(self):
+        async with self._lock:
+            if self._crawler is not None:
+                await self._crawler.close()
+                self._crawler = None
+    
+    async def __aenter__(self) -> "_LazyBrowser":
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        if not self.persistent:
+            await self.close()
+
+
+# =============================================================================
+# DEDUPLICATION
+# =============================================================================
+
+class NearDuplicateFilter:
+    """
+    Near-duplicate detection with MinHash signatures and LSH banding.
+    
+    Each document is reduced to a `num_perm`-value MinHash signature over
+    word shingles. Signatures are split into `bands`; documents sharing any
+    band bucket become candidate pairs, which are confirmed by estimated
+    Jaccard similarity. This avoids comparing every pair of pages.
+    """
+    
+    _PRIME = (1 << 61) - 1
     
-    async def synthesize(self, query: str, sources: List[dict]) -> str:
-        """Create synthesized report from sources"""
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, bands: int = 32,
+                 shingle_size: int = 5, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
         
-        # Create source summaries
-        source_texts = []
-        for i, source in enumerate(sources, 1):
-            content_preview = source['content'][:1000]  # First 1000 chars to save tokens
-            source_texts.append(f"""Source {i}: {source['title']}
-URL: {source['url']}
-{content_preview}""")
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.reset()
+    
+    def reset(self):
+        """Forget the snippets recorded by `seen_snippet`"""
+        self._snippet_signatures: List[np.ndarray] = []
+        self._snippet_buckets: Dict[bytes, List[int]] = {}
+    
+    def signature(self, text: str, shingle_size: Optional[int] = None) -> np.ndarray:
+        """MinHash signature of the text's word shingles"""
+        k = shingle_size or self.shingle_size
+        words = re.findall(r"\w+", text.lower())
+        if len(words) < k:
+            shingles = {" ".join(words)}
+        else:
+            shingles = {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+        
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+        # (a*x + b) mod p for every permutation/shingle pair, min per permutation;
+        # a, x < 2^32 so the product fits in uint64
+        permuted = (np.outer(hashes, self._a) + self._b) % self._PRIME
+        return permuted.min(axis=0)
+    
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [
+            bytes([band]) + signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            for band in range(self.bands)
+        ]
+    
+    def filter(self, sources: List[dict]):
+        """
+        Keep one representative (the longest page) per near-duplicate cluster.
+        
+        Returns (kept_sources, stats) where stats reports how many pages and
+        estimated tokens were dropped.
+        """
+        signatures = [self.signature(s.get('content') or "") for s in sources]
+        
+        # Union-find over candidate pairs from shared LSH buckets
+        parent = list(range(len(sources)))
+        
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+        
+        buckets: Dict[bytes, List[int]] = {}
+        for i, sig in enumerate(signatures):
+            for key in self._band_keys(sig):
+                for j in buckets.setdefault(key, []):
+                    if find(i) != find(j) and np.mean(sig == signatures[j]) >= self.threshold:
+                        parent[find(i)] = find(j)
+                buckets[key].append(i)
+        
+        clusters: Dict[int, List[int]] = {}
+        for i in range(len(sources)):
+            clusters.setdefault(find(i), []).append(i)
+        
+        keep = set()
+        for members in clusters.values():
+            keep.add(max(members, key=lambda i: (len(sources[i].get('content') or ""), -i)))
+        
+        kept = [s for i, s in enumerate(sources) if i in keep]
+        dropped = [s for i, s in enumerate(sources) if i not in keep]
+        stats = {
+            "duplicates_removed": len(dropped),
+            "clusters": len(clusters),
+            "tokens_saved": sum(estimate_tokens(s.get('content') or "") for s in dropped)
+        }
+        return kept, stats
+    
+    def seen_snippet(self, snippet: str) -> bool:
+        """
+        Record a search snippet; True if a near-identical one was seen before.
+        
+        Syndicated copies of an article usually share their search snippet,
+        so this can skip crawling them at all.
+        """
+        if not snippet.strip():
+            return False
+        sig = self.signature(snippet, shingle_size=3)
+        keys = self._band_keys(sig)
+        
+        for key in keys:
+            for j in self._snippet_buckets.get(key, []):
+                if np.mean(sig == self._snippet_signatures[j]) >= self.threshold:
+                    return True
+        
+        self._snippet_signatures.append(sig)
+        for key in keys:
+            self._snippet_buckets.setdefault(key, []).append(len(self._snippet_signatures) - 1)
+        return False
+
+
+# =============================================================================
+# SYNTHESIS
+# =============================================================================
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)"""
+    return len(text) // 4 + 1
+
+
+class PassageRanker:
+    """
+    Query-focused passage selection for synthesis context.
+    
+    Splits each source's markdown into passages, scores every passage
+    against the research query and search keywords with BM25, and packs
+    the best ones into a token budget. Each source first gets its single
+    best passage (so one verbose page can't crowd out the rest), then the
+    remaining budget goes to the highest-scoring passages overall.
+    """
+    
+    STOPWORDS = frozenset(
+        "a an and are as at be by for from has have how in is it its of on or "
+        "that the this to was were what when where which who why will with".split()
+    )
+    
+    def __init__(self, passage_tokens: int = 200, k1: float = 1.5, b: float = 0.75):
+        self.passage_chars = passage_tokens * 4
+        self.k1 = k1
+        self.b = b
+    
+    def tokenize(self, text: str) -> List[str]:
+        return [
+            t for t in re.findall(r"\w+", text.lower())
+            if len(t) > 1 and t not in self.STOPWORDS
+        ]
+    
+    def split(self, markdown: str) -> List[str]:
+        """Split markdown into roughly passage-sized chunks on paragraph breaks"""
+        passages = []
+        current = ""
+        for block in re.split(r"\n\s*\n", markdown):
+            block = block.strip()
+            if not block:
+                continue
+            
+            # Hard-wrap blocks that are much longer than one passage,
+            # after whatever was buffered before them
+            if current and len(block) > 2 * self.passage_chars:
+                passages.append(current)
+                current = ""
+            while len(block) > 2 * self.passage_chars:
+                passages.append(block[:self.passage_chars])
+                block = block[self.passage_chars:]
+            
+            if current and len(current) + len(block) > self.passage_chars:
+                passages.append(current)
+                current = ""
+            current = f"{current}\n\n{block}" if current else block
+        if current:
+            passages.append(current)
+        return passages
+    
+    def score(self, query_terms: Counter, passages: List[List[str]]) -> np.ndarray:
+        """BM25 score of each tokenized passage for the weighted query terms"""
+        if not passages or not query_terms:
+            return np.zeros(len(passages))
+        
+        terms = list(query_terms)
+        index = {t: j for j, t in enumerate(terms)}
+        tf = np.zeros((len(passages), len(terms)))
+        for i, tokens in enumerate(passages):
+            for token in tokens:
+                j = index.get(token)
+                if j is not None:
+                    tf[i, j] += 1
+        
+        doc_len = np.array([len(tokens) for tokens in passages], dtype=float)
+        avg_len = doc_len.mean() or 1.0
+        df = (tf > 0).sum(axis=0)
+        n = len(passages)
+        idf = np.log((n - df + 0.5) / (df + 0.5) + 1.0)
+        
+        norm = self.k1 * (1 - self.b + self.b * doc_len / avg_len)
+        bm25 = tf * (self.k1 + 1) / (tf + norm[:, None])
+        weights = np.array([query_terms[t] for t in terms], dtype=float)
+        return bm25 @ (idf * weights)
+    
+    def select(self, query: str, keywords: List[str], sources: List[dict],
+               token_budget: int) -> List[dict]:
+        """
+        Return the url, title and selected passages ('context', in original
+        order) of each source, dropping sources with nothing relevant.
+        
+        If no passage matches any term at all, each source's leading
+        passages are used instead, so crawled sources aren't all lost.
+        """
+        # Original query terms count double relative to generated keywords
+        query_terms = Counter(self.tokenize(query))
+        query_terms.update({t: c for t, c in query_terms.items()})
+        for keyword in keywords:
+            query_terms.update(self.tokenize(keyword))
+        
+        owners, positions, texts = [], [], []
+        for s_idx, source in enumerate(sources):
+            for p_idx, passage in enumerate(self.split(source.get('content') or "")):
+                owners.append(s_idx)
+                positions.append(p_idx)
+                texts.append(passage)
+        
+        scores = self.score(query_terms, [self.tokenize(t) for t in texts])
+        order = np.argsort(-scores, kind="stable")
+        
+        chosen = set()
+        used = 0
+        
+        def take(i: int, relevant_only: bool = True) -> bool:
+            nonlocal used
+            cost = estimate_tokens(texts[i])
+            if i in chosen or (relevant_only and scores[i] <= 0) or used + cost > token_budget:
+                return False
+            chosen.add(i)
+            used += cost
+            return True
         
-        all_sources = "\n---\n".join(source_texts)
+        # Pass 1: best passage of each source; pass 2: best passages overall
+        covered = set()
+        for i in order:
+            if owners[i] not in covered and take(i):
+                covered.add(owners[i])
+        for i in order:
+            take(i)
+        if not chosen:
+            # Nothing scored: first passage of every source, then the next ones
+            for i in sorted(range(len(texts)), key=lambda i: (positions[i], owners[i])):
+                take(i, relevant_only=False)
         
-        prompt = f"""You are a research assistant. Synthesize the following sources into a comprehensive report.
+        by_source: Dict[int, List[int]] = {}
+        for i in sorted(chosen, key=lambda i: (owners[i], positions[i])):
+            by_source.setdefault(owners[i], []).append(i)
+        
+        selected = []
+        for s_idx, indexes in by_source.items():
+            # Only what synthesis needs, so spooled page text stays on disk
+            selected.append({
+                'url': sources[s_idx]['url'],
+                'title': sources[s_idx].get('title', ''),
+                'context': "\n\n[...]\n\n".join(texts[i] for i in indexes)
+            })
+        return selected
+
+
+class SynthesisEngine:
+    """
+    Synthesizes crawled content into a research report
+    
+    Modes:
+    - "single": one strong-model call over a short preview of every source
+    - "map_reduce": each source is summarized concurrently by the fast model
+      (map), then summaries are merged in batches by the strong model until
+      they fit a single final call (reduce)
+    """
+    
+    MODES = ("single", "map_reduce")
+    
+    def __init__(
+        self,
+        llm: MoonshotProvider,
+        model: str,
+        fast_model: Optional[str] = None,
+        mode: str = "single",
+        map_concurrency: int = 5,
+        map_source_max_tokens: int = 6000,
+        map_token_budget: int = 300_000,
+        reduce_fan_in: int = 8,
+        reduce_max_tokens: int = 60_000
+    ):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown synthesis mode '{mode}' (expected one of: {', '.join(self.MODES)})")
+        if reduce_fan_in < 2:
+            raise ValueError(f"reduce_fan_in must be at least 2 (got {reduce_fan_in})")
+        self.llm = llm
+        self.model = model
+        self.fast_model = fast_model or model
+        self.mode = mode
+        self.map_concurrency = map_concurrency
+        self.map_source_max_tokens = map_source_max_tokens
+        self.map_token_budget = map_token_budget
+        self.reduce_fan_in = reduce_fan_in
+        self.reduce_max_tokens = reduce_max_tokens
+        self.timings: Dict[str, float] = {}
+    
+    def _report_prompt(self, query: str, source_block: str, source_count: int) -> str:
+        return f"""You are a research assistant. Synthesize the following sources into a comprehensive report.
 
 ORIGINAL RESEARCH QUESTION:
 {query}
 
-SOURCES FOUND ({len(sources)} total):
-{all_sources}
+SOURCES FOUND ({source_count} total):
+{source_block}
 
 INSTRUCTIONS:
 1. Write an executive summary (3-5 bullet points)
@@ -340,15 +2873,211 @@ INSTRUCTIONS:
 5. Highlight any contradictions or gaps in the information
 
 Format in clean Markdown."""
+    
+    async def synthesize(
+        self,
+        query: str,
+        sources: List[dict],
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """
+        Create synthesized report from sources
+        
+        If `on_token` is given the report is streamed through it as it is
+        generated. Total latency and, when streaming, time to first token
+        (both measured from the start of synthesis) are recorded in
+        `self.timings`.
+        """
+        start = time.perf_counter()
+        self.timings = {}
+        
+        if self.mode == "map_reduce":
+            source_block = await self._map_reduce(query, sources)
+        else:
+            # Create source summaries
+            source_texts = []
+            for i, source in enumerate(sources, 1):
+                # Selected passages if ranked, otherwise the first 1000 chars to save tokens
+                content_preview = source.get('context') or source['content'][:1000]
+                source_texts.append(f"""Source {i}: {source['title']}
+URL: {source['url']}
+{content_preview}""")
+            
+            source_block = "\n---\n".join(source_texts)
+        
+        prompt = self._report_prompt(query, source_block, len(sources))
         
-        report = await self.llm.generate(prompt, model=self.model)
+        def timed_on_token(token: str):
+            if "synthesis_ttft_s" not in self.timings:
+                self.timings["synthesis_ttft_s"] = time.perf_counter() - start
+            on_token(token)
+        
+        report = await self.llm.generate(
+            prompt,
+            model=self.model,
+            stream=on_token is not None,
+            on_token=timed_on_token if on_token else None
+        )
+        self.timings["synthesis_s"] = time.perf_counter() - start
         return report
+    
+    async def _map_reduce(self, query: str, sources: List[dict]) -> str:
+        """Summarize sources in parallel, then merge until the result fits one call"""
+        map_start = time.perf_counter()
+        
+        # Split the map budget evenly, capped per source
+        per_source_tokens = self.map_source_max_tokens
+        if sources:
+            per_source_tokens = min(per_source_tokens, self.map_token_budget // len(sources))
+        per_source_chars = max(1000, per_source_tokens * 4)
+        
+        semaphore = asyncio.Semaphore(self.map_concurrency)
+        
+        async def summarize(i: int, source: dict) -> str:
+            async with semaphore:
+                summary = await self._summarize_source(query, source, per_source_chars)
+            return f"""Source {i}: {source['title']}
+URL: {source['url']}
+{summary}"""
+        
+        summaries = await asyncio.gather(
+            *[summarize(i, source) for i, source in enumerate(sources, 1)]
+        )
+        self.timings["map_s"] = time.perf_counter() - map_start
+        
+        reduce_start = time.perf_counter()
+        rounds = 0
+        while len(summaries) > 1 and (
+            len(summaries) > self.reduce_fan_in
+            or estimate_tokens("".join(summaries)) > self.reduce_max_tokens
+        ):
+            batches = [
+                summaries[i:i + self.reduce_fan_in]
+                for i in range(0, len(summaries), self.reduce_fan_in)
+            ]
+            summaries = await asyncio.gather(
+                *[self._reduce_batch(query, batch) for batch in batches]
+            )
+            rounds += 1
+        self.timings["reduce_s"] = time.perf_counter() - reduce_start
+        self.timings["reduce_rounds"] = rounds
+        
+        return "\n---\n".join(summaries)
+    
+    async def _summarize_source(self, query: str, source: dict, max_chars: int) -> str:
+        """Map step: condense one source to the facts relevant to the query"""
+        prompt = f"""Summarize this source for a research report.
+
+RESEARCH QUESTION:
+{query}
+
+SOURCE: {source['title']}
+URL: {source['url']}
+{source['content'][:max_chars]}
+
+Keep only information relevant to the research question: key facts, figures,
+dates, named entities and short direct quotes. At most 200 words, as bullet
+points. If nothing is relevant, reply "No relevant information"."""
+        
+        try:
+            return await self.llm.generate(prompt, model=self.fast_model)
+        except ReplayCacheMiss:
+            raise
+        except Exception as e:
+            print(f"   ⚠️  Summary failed for {source['url'][:50]}: {e}")
+            return source['content'][:1000]
+    
+    async def _reduce_batch(self, query: str, batch: List[str]) -> str:
+        """Reduce step: merge several source summaries, keeping attributions"""
+        prompt = f"""Merge these research notes into one consolidated set of notes.
+
+RESEARCH QUESTION:
+{query}
+
+NOTES:
+{chr(10).join(batch)}
+
+Keep every distinct fact, figure and quote, and keep each one attributed to
+its source number and URL. Remove repetition. Note any contradictions
+between sources."""
+        
+        return await self.llm.generate(prompt, model=self.model)
 
 
 # =============================================================================
 # MAIN RESEARCH AGENT
 # =============================================================================
 
+class StageGraph:
+    """
+    The research pipeline as a dependency graph of async stages.
+    
+    A stage is a coroutine function called with the outputs of the stages
+    it needs as keyword arguments (`needs` lists stage names used as the
+    argument names, or maps argument names to stages). `run()` starts
+    every stage its targets transitively depend on as soon as that stage's
+    own inputs are ready, so independent stages overlap; stages no target
+    depends on are skipped. Stages must be added after the stages they
+    need, which keeps the graph acyclic.
+    """
+    
+    def __init__(self):
+        self.stages: Dict[str, tuple] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+        self.skipped: List[str] = []
+    
+    def add(self, name: str, run: Callable[..., Awaitable[Any]], needs=()):
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' is already defined")
+        inputs = dict(needs) if isinstance(needs, dict) else {dep: dep for dep in needs}
+        unknown = [dep for dep in inputs.values() if dep not in self.stages]
+        if unknown:
+            raise ValueError(f"Stage '{name}' needs undefined stages: {', '.join(unknown)}")
+        self.stages[name] = (run, inputs)
+    
+    async def run(self, *targets: str) -> Dict[str, Any]:
+        """Run what `targets` need; returns their outputs by stage name"""
+        needed = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in needed:
+                needed.add(name)
+                pending.extend(self.stages[name][1].values())
+        self.skipped = [name for name in self.stages if name not in needed]
+        self.timings = {}
+        
+        start = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+        
+        async def run_stage(name: str):
+            run, inputs = self.stages[name]
+            kwargs = {arg: await tasks[dep] for arg, dep in inputs.items()}
+            stage_start = time.perf_counter()
+            with trace_span(name):
+                result = await run(**kwargs)
+            self.timings[name] = {
+                "start_s": stage_start - start,
+                "duration_s": time.perf_counter() - stage_start
+            }
+            return result
+        
+        # Definition order is a topological order, so every task's inputs exist
+        for name in self.stages:
+            if name in needed:
+                tasks[name] = asyncio.create_task(run_stage(name))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+        return {name: tasks[name].result() for name in targets}
+    
+    def report(self) -> Dict[str, Any]:
+        return {"timings": self.timings, "skipped": self.skipped}
+
+
 @dataclass
 class ResearchReport:
     """Output from research agent"""
@@ -359,79 +3088,423 @@ class ResearchReport:
     crawled_urls: List[str]
     token_usage: Dict[str, Any]
     cost_estimate_usd: float
+    timings: Dict[str, float] = field(default_factory=dict)
+    metrics: Dict[str, Any] = field(default_factory=dict)
+    trace: Optional[Trace] = field(default=None, repr=False)   # spans of the run, see `Trace`
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-friendly report; page contents are left out of `sources`"""
+        return {
+            "query": self.query,
+            "markdown": self.markdown,
+            "sources": [{"url": s["url"], "title": s.get("title", "")} for s in self.sources],
+            "search_queries": self.search_queries,
+            "crawled_urls": self.crawled_urls,
+            "token_usage": self.token_usage,
+            "cost_estimate_usd": self.cost_estimate_usd,
+            "timings": self.timings,
+            "metrics": self.metrics
+        }
 
 
 class ResearchAgent:
     """Main research agent - Moonshot Only"""
     
-    def __init__(self, config: ResearchConfig = None):
+    def __init__(
+        self,
+        config: ResearchConfig = None,
+        brave_limiter: Optional[TokenBucket] = None,
+        llm_limiter=None,
+        crawl_limiter=None
+    ):
+        """
+        The optional limiters replace the agent's own Brave rate limit and
+        add caps on concurrent Moonshot calls and live page fetches; the job
+        queue passes limiters shared by all of its worker processes.
+        """
         self.config = config or ResearchConfig()
         
-        # Validate API keys
-        if not self.config.moonshot_api_key:
+        # Cassette replay serves every request from the archive; caches are
+        # bypassed in both modes so each call reaches the recorded transport
+        self.cassette = Cassette(
+            self.config.cassette_path,
+            mode=self.config.cassette_mode,
+            latency_scale=self.config.cassette_latency_scale
+        ) if self.config.cassette_path else None
+        offline = self.cassette is not None and self.cassette.replaying
+        if self.cassette is not None and self.config.llm_replay:
+            raise ValueError("llm_replay and a cassette are mutually exclusive")
+        
+        # Validate API keys (replay modes never call the APIs)
+        if not self.config.moonshot_api_key and not self.config.llm_replay and not offline:
             raise ValueError("MOONSHOT_API_KEY is required")
-        if not self.config.brave_api_key:
+        if not self.config.brave_api_key and not offline:
             raise ValueError("BRAVE_API_KEY is required for search (free tier available)")
         
         # Initialize providers
-        self.llm = MoonshotProvider(self.config.moonshot_api_key)
-        self.search = BraveSearchClient(self.config.brave_api_key)
+        use_llm_cache = (self.config.enable_llm_cache or self.config.llm_replay) and self.cassette is None
+        self.llm = MoonshotProvider(
+            self.config.moonshot_api_key,
+            cache=SQLiteCache(
+                self.config.llm_cache_path,
+                table="llm_responses",
+                default_ttl=self.config.llm_cache_ttl,
+                max_bytes=int(self.config.llm_cache_max_mb * 1024 * 1024)
+            ) if use_llm_cache else None,
+            replay=self.config.llm_replay,
+            limiter=llm_limiter,
+            base_url=self.config.moonshot_base_url,
+            cassette=self.cassette
+        )
+        self.search = BraveSearchClient(
+            self.config.brave_api_key or "replay-only",
+            base_url=self.config.brave_base_url,
+            pool_limit=self.config.http_pool_limit,
+            pool_limit_per_host=self.config.http_pool_limit_per_host,
+            dns_cache_ttl=self.config.dns_cache_ttl,
+            keepalive_timeout=self.config.keepalive_timeout,
+            rate_limiter=brave_limiter or TokenBucket(self._brave_rate()),
+            max_concurrent=self.config.max_concurrent_searches,
+            cache=SQLiteCache(
+                self.config.search_cache_path,
+                table="search_results",
+                default_ttl=self.config.search_cache_ttl,
+                max_bytes=int(self.config.search_cache_max_mb * 1024 * 1024)
+            ) if self.config.enable_search_cache and self.cassette is None else None,
+            cassette=self.cassette
+        )
         
         # Initialize modules with appropriate models
+        if self.config.planning_mode not in QueryAnalyzer.PLANNING_MODES:
+            raise ValueError(
+                f"Unknown planning_mode '{self.config.planning_mode}' "
+                f"(expected one of: {', '.join(QueryAnalyzer.PLANNING_MODES)})"
+            )
         self.analyzer = QueryAnalyzer(self.llm, self.config.fast_model)
         self.crawler = ContentCrawler(
             max_concurrent=self.config.max_concurrent_crawls,
-            timeout=self.config.crawl_timeout
+            timeout=self.config.crawl_timeout,
+            cache=SQLiteCache(
+                self.config.crawl_cache_path,
+                table="crawled_pages",
+                default_ttl=self.config.crawl_cache_max_age_s,
+                max_bytes=int(self.config.crawl_cache_max_mb * 1024 * 1024),
+                compress=True
+            ) if self.config.enable_crawl_cache and self.cassette is None else None,
+            cache_fresh_s=self.config.crawl_cache_fresh_s,
+            fetch_mode=self.config.crawl_fetch_mode,
+            static_min_words=self.config.static_min_words,
+            resource_profile=self.config.browser_resource_profile,
+            blocked_domains=self.config.blocked_domains,
+            keep_browser=self.config.keep_browser_warm,
+            limiter=crawl_limiter,
+            markdown_workers=self.config.markdown_workers,
+            max_page_chars=self.config.max_page_chars,
+            cassette=self.cassette,
+            scheduler=HostScheduler(
+                AIMDController(
+                    self.config.max_concurrent_crawls,
+                    minimum=1 if self.config.crawl_adaptive else self.config.max_concurrent_crawls,
+                    maximum=(self.config.crawl_max_concurrency if self.config.crawl_adaptive
+                             else self.config.max_concurrent_crawls),
+                    latency_target=self.config.crawl_latency_target
+                ),
+                per_host=self.config.crawl_per_host,
+                host_delay=self.config.crawl_host_delay
+            )
+        )
+        self.deduper = NearDuplicateFilter(
+            threshold=self.config.dedup_threshold
+        ) if self.config.enable_dedup else None
+        self._snippets_skipped = 0
+        self.ranker = PassageRanker(
+            passage_tokens=self.config.passage_tokens
+        ) if self.config.enable_passage_selection else None
+        self.synthesizer = SynthesisEngine(
+            self.llm,
+            self.config.strong_model,
+            fast_model=self.config.fast_model,
+            mode=self.config.synthesis_mode,
+            map_concurrency=self.config.map_concurrency,
+            map_source_max_tokens=self.config.map_source_max_tokens,
+            map_token_budget=self.config.map_token_budget,
+            reduce_fan_in=self.config.reduce_fan_in
+        )
+    
+    def _brave_rate(self) -> float:
+        """Requests/sec for the configured Brave plan"""
+        if self.config.brave_rate_limit:
+            return self.config.brave_rate_limit
+        if self.config.brave_tier not in BRAVE_RATE_TIERS:
+            raise ValueError(
+                f"Unknown brave_tier '{self.config.brave_tier}' "
+                f"(expected one of: {', '.join(BRAVE_RATE_TIERS)})"
+            )
+        return BRAVE_RATE_TIERS[self.config.brave_tier]
+    
+    async def close(self):
+        """Release pooled connections and caches held by the agent's clients; save a recording"""
+        await self.search.close()
+        await self.crawler.close()
+        self.llm.close()
+        if self.cassette is not None:
+            self.cassette.save()
+    
+    async def __aenter__(self) -> "ResearchAgent":
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    def reset_run_stats(self):
+        """Zero per-run counters so a reused agent reports each run on its own"""
+        self.llm.reset_usage()
+        self.crawler.reset_stats()
+        if self.search.cache is not None:
+            self.search.cache.reset_stats()
+        reset_peak_rss()
+        if self.deduper is not None:
+            self.deduper.reset()
+        self._snippets_skipped = 0
+    
+    def _snippet_already_seen(self, result: Dict[str, Any]) -> bool:
+        """Skip crawling results whose snippet matches an earlier result's"""
+        if self.deduper is None:
+            return False
+        if self.deduper.seen_snippet(result.get("description", "")):
+            self._snippets_skipped += 1
+            return True
+        return False
+    
+    async def _search_and_crawl(self, keywords: List[str], weights: Optional[Dict[str, float]] = None):
+        """
+        Run search and crawl as a producer/consumer pipeline.
+        
+        Searches fuse their results into a CrawlFrontier as each one returns,
+        and crawl workers take the best-ranked URL available, so the stage
+        takes roughly as long as the slower of the two instead of their sum.
+        `weights` (per keyword) favour results of high-priority queries.
+        """
+        # Hedged mode queues extra candidates and stops once enough succeed
+        candidates = math.ceil(self.config.max_crawl_urls * max(1.0, self.config.crawl_hedge_factor))
+        frontier = CrawlFrontier(
+            max_urls=candidates,
+            k=self.config.rank_fusion_k,
+            warmup=min(self.config.rank_fusion_warmup, max(1, len(keywords)))
         )
-        self.synthesizer = SynthesisEngine(self.llm, self.config.strong_model)
+        
+        search_task = asyncio.create_task(self.search.search_to_frontier(
+            keywords,
+            frontier,
+            skip_result=self._snippet_already_seen if self.config.dedup_snippets else None,
+            weights=weights
+        ))
+        crawl_task = asyncio.create_task(self.crawler.crawl_frontier(
+            frontier,
+            target=self.config.max_crawl_urls,
+            # <= 0 (e.g. from a daemon job option) also means no deadline
+            deadline=self.config.crawl_stage_timeout if (self.config.crawl_stage_timeout or 0) > 0 else None
+        ))
+        
+        try:
+            # Surface a crawler failure immediately rather than after all searches
+            done, _ = await asyncio.wait(
+                [search_task, crawl_task],
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if crawl_task in done:
+                crawl_task.result()
+            
+            await search_task
+            sources = await crawl_task
+        finally:
+            for task in (search_task, crawl_task):
+                if not task.done():
+                    task.cancel()
+        
+        return frontier.ranked_urls(), sources
     
-    async def research(self, query: str) -> ResearchReport:
+    async def research(
+        self,
+        query: str,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> ResearchReport:
         """
         Main research pipeline:
-        1. Analyze query
-        2. Generate search keywords
-        3. Search web (Brave)
-        4. Crawl URLs
-        5. Synthesize report
+        1. Plan sub-topics and prioritized search queries
+        2. Search web (Brave)
+        3. Crawl URLs (streamed from search as results arrive)
+        4. Deduplicate and rank sources
+        5. Synthesize report (streamed through `on_token` if given)
+        
+        The steps are stages of a StageGraph wired by their inputs, so each
+        starts as soon as what it needs is done. Per-stage timings are in
+        `timings` and `metrics["stages"]`.
+        
+        Every stage, search, page fetch and LLM call is recorded as a span
+        in the report's `trace`.
         """
+        trace = Trace(query)
+        # Page text of this run goes to its own spool, closed along with the
+        # report whose sources read from it (or right away if the run fails)
+        spool = self.crawler.spool = PageSpool(CACHE_DIR) if self.config.spool_pages else None
+        try:
+            with trace.activate(), trace.span("research", query):
+                report = await self._research(query, on_token)
+        except BaseException:
+            if spool is not None:
+                spool.close()
+            raise
+        finally:
+            self.crawler.spool = None
+        if spool is not None:
+            weakref.finalize(report, spool.close)
+        report.trace = trace
+        report.metrics["trace"] = trace.summary()
+        return report
+    
+    async def _research(
+        self,
+        query: str,
+        on_token: Optional[Callable[[str], None]]
+    ) -> ResearchReport:
+        start = time.perf_counter()
+        self.reset_run_stats()
         print(f"🔍 Starting research: {query[:60]}...")
         print("🌙 Using Moonshot-only ecosystem\n")
         
-        # Step 1: Analyze query
-        print("📊 Analyzing query...")
-        analysis = await self.analyzer.analyze(query)
+        metrics: Dict[str, Any] = {}
+        graph = StageGraph()
         
-        # Step 2: Generate search keywords
-        print("🎯 Generating search queries...")
-        keywords = await self.analyzer.generate_keywords(
-            query, 
-            count=self.config.max_search_queries
-        )
-        print(f"   Generated {len(keywords)} search queries")
-        
-        # Step 3: Search web (Brave)
-        print("🌐 Searching web (Brave)...")
-        urls = await self.search.search_multiple(keywords)
-        print(f"   Found {len(urls)} unique URLs")
-        
-        # Step 4: Crawl URLs
-        print("🕷️  Crawling content...", flush=True)
-        sources = await self.crawler.crawl_urls(
-            urls, 
-            max_urls=self.config.max_crawl_urls
-        )
-        print(f"   Successfully crawled {len(sources)} pages", flush=True)
+        async def plan() -> ResearchPlan:
+            if self.config.planning_mode == "structured":
+                print("🎯 Planning research...")
+                plan = await self.analyzer.plan(query, count=self.config.max_search_queries)
+            else:
+                print("🎯 Generating search queries...")
+                plan = ResearchPlan.from_keywords(await self.analyzer.generate_keywords(
+                    query, 
+                    count=self.config.max_search_queries
+                ))
+            annotate(results=len(plan.queries), fallback=plan.fallback)
+            if plan.sub_topics:
+                high = sum(1 for q in plan.queries if q["priority"] == 1)
+                print(f"   Planned {len(plan.queries)} search queries ({high} high priority) "
+                      f"across {len(plan.sub_topics)} sub-topics")
+            else:
+                print(f"   Generated {len(plan.queries)} search queries")
+            metrics["plan"] = plan.to_dict()
+            return plan
+        
+        async def search_and_crawl(plan: ResearchPlan) -> List[dict]:
+            # Search web (Brave) and crawl results as they arrive
+            print("🌐 Searching web (Brave) and crawling content...", flush=True)
+            urls, sources = await self._search_and_crawl(plan.keywords, weights=plan.weights())
+            annotate(urls=len(urls), pages=len(sources))
+            print(f"   Found {len(urls)} unique URLs")
+            print(f"   Successfully crawled {len(sources)} pages", flush=True)
+            
+            metrics["crawl"] = dict(self.crawler.crawl_counts, concurrency=self.crawler.scheduler.report())
+            metrics["browser_resources"] = resources = self.crawler.resource_report()
+            if resources["blocked_requests"]:
+                print(f"   Blocked {resources['blocked_requests']} browser requests "
+                      f"across {resources['pages']} rendered pages ({resources['profile']} profile)")
+            if self.crawler.cache is not None:
+                metrics["crawl_cache"] = self.crawler.cache_report()
+                hits = metrics["crawl_cache"]["fresh"] + metrics["crawl_cache"]["revalidated"]
+                if hits:
+                    print(f"   Crawl cache: {hits} pages served without rendering "
+                          f"({metrics['crawl_cache']['revalidated']} revalidated)")
+            return sources
+        
+        async def dedup(search_and_crawl: List[dict]) -> List[dict]:
+            annotate(pages=len(search_and_crawl))
+            sources, dedup_stats = self.deduper.filter(search_and_crawl)
+            dedup_stats["snippets_skipped"] = self._snippets_skipped
+            metrics["dedup"] = dedup_stats
+            if dedup_stats["duplicates_removed"] or self._snippets_skipped:
+                print(f"   Removed {dedup_stats['duplicates_removed']} near-duplicate pages "
+                      f"(~{dedup_stats['tokens_saved']:,} tokens saved), "
+                      f"skipped {self._snippets_skipped} duplicate snippets")
+            return sources
+        
+        async def rank(plan: ResearchPlan, sources: List[dict]) -> List[dict]:
+            context_sources = self.ranker.select(
+                query, plan.keywords, sources, self.config.context_token_budget
+            )
+            context_tokens = sum(estimate_tokens(s['context']) for s in context_sources)
+            print(f"   Selected passages from {len(context_sources)} sources (~{context_tokens:,} tokens)")
+            return context_sources
         
-        # Step 5: Synthesize report
-        print("📝 Synthesizing report...")
-        report_text = await self.synthesizer.synthesize(query, sources)
+        async def synthesize(context: List[dict]) -> str:
+            annotate(mode=self.synthesizer.mode, sources=len(context))
+            print("📝 Synthesizing report...", flush=True)
+            report_text = await self.synthesizer.synthesize(query, context, on_token=on_token)
+            if on_token:
+                print(flush=True)
+            return report_text
+        
+        # Steps, wired by their inputs: stages run once what they need is done
+        graph.add("plan", plan)
+        graph.add("search_and_crawl", search_and_crawl, needs=["plan"])
+        sources_stage = "search_and_crawl"
+        if self.deduper is not None:
+            graph.add("dedup", dedup, needs=["search_and_crawl"])
+            sources_stage = "dedup"
+        context_stage = sources_stage
+        if self.ranker is not None and self.synthesizer.mode == "single":
+            graph.add("rank", rank, needs={"plan": "plan", "sources": sources_stage})
+            context_stage = "rank"
+        graph.add("synthesize", synthesize, needs={"context": context_stage})
+        
+        outputs = await graph.run("synthesize", "plan", sources_stage)
+        report_text = outputs["synthesize"]
+        keywords = outputs["plan"].keywords
+        sources = outputs[sources_stage]
+        metrics["stages"] = graph.report()
         
         # Get usage stats
         usage = self.llm.get_usage_report()
+        timings = dict(
+            self.synthesizer.timings,
+            **{f"{name}_s": stage["duration_s"] for name, stage in graph.timings.items()},
+            total_s=time.perf_counter() - start
+        )
         
         print(f"✅ Research complete!")
         print(f"   Tokens used: {usage['input_tokens']:,} in / {usage['output_tokens']:,} out")
         print(f"   Est. cost: ${usage['cost_usd']:.3f}")
+        print(f"   Latency: {timings['total_s']:.1f}s total, " + (
+            f"synthesis first token {timings['synthesis_ttft_s']:.1f}s of {timings['synthesis_s']:.1f}s"
+            if "synthesis_ttft_s" in timings else f"synthesis {timings['synthesis_s']:.1f}s"
+        ))
+        print("   Stages: " + ", ".join(
+            f"{name} {stage['duration_s']:.1f}s" for name, stage in graph.timings.items()
+        ) + (f" (skipped: {', '.join(graph.skipped)})" if graph.skipped else ""))
+        if usage['cache_hits']:
+            print(f"   LLM cache: {usage['cache_hits']} hits saved "
+                  f"{usage['cached_input_tokens']:,} in / {usage['cached_output_tokens']:,} out "
+                  f"(${usage['cached_cost_usd_saved']:.3f})")
+        if self.search.cache is not None:
+            cache_stats = self.search.cache.stats()
+            print(f"   Search cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+        
+        if self.cassette is not None:
+            metrics["cassette"] = self.cassette.report()
+            if self.cassette.replaying:
+                stats = metrics["cassette"]
+                print(f"   Cassette: replayed {sum(v for k, v in stats.items() if k.endswith('_replayed'))} "
+                      f"responses, {sum(v for k, v in stats.items() if k.endswith('_fallbacks'))} fallbacks, "
+                      f"{sum(v for k, v in stats.items() if k.endswith('_misses'))} misses "
+                      f"(latency x{self.cassette.latency_scale:g})")
+        
+        metrics["memory"] = memory_usage()
+        if self.crawler.spool is not None:
+            metrics["memory"]["spool"] = self.crawler.spool.stats()
+        print(f"   Peak RSS: {metrics['memory']['peak_rss_mb']:.0f} MB"
+              + (f" (page text spooled to disk: {metrics['memory']['spool']['raw_bytes'] / 1e6:.1f} MB "
+                 f"-> {metrics['memory']['spool']['stored_bytes'] / 1e6:.1f} MB compressed)"
+                 if "spool" in metrics["memory"] else ""))
         
         return ResearchReport(
             query=query,
@@ -440,7 +3513,9 @@ class ResearchAgent:
             search_queries=keywords,
             crawled_urls=[s['url'] for s in sources],
             token_usage=usage,
-            cost_estimate_usd=usage['cost_usd']
+            cost_estimate_usd=usage['cost_usd'],
+            timings=timings,
+            metrics=metrics
         )
 
 
@@ -448,19 +3523,151 @@ class ResearchAgent:
 # CLI INTERFACE
 # =============================================================================
 
+def load_batch(path: str) -> List[Dict[str, Any]]:
+    """
+    Queries for --batch: a .jsonl file of {"query": ..., "id": ...} objects,
+    or any other file with one query per line (blank lines and # comments
+    are skipped). Items without an id are numbered from 1.
+    """
+    items = []
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if path.endswith(".jsonl"):
+                item = json.loads(line)
+                if isinstance(item, str):
+                    item = {"query": item}
+                if not isinstance(item, dict):
+                    raise ValueError(f"{path}:{line_no}: expected an object or a string, got {type(item).__name__}")
+                if not item.get("query"):
+                    raise ValueError(f"{path}:{line_no}: missing 'query'")
+            else:
+                item = {"query": line}
+            item.setdefault("id", len(items) + 1)
+            items.append(item)
+    return items
+
+
+async def run_batch(
+    config: ResearchConfig,
+    items: List[Dict[str, Any]],
+    output_path: str,
+    traces: Optional[List[Trace]] = None
+) -> Dict[str, Any]:
+    """
+    Research every item with one agent, appending a JSONL line per query.
+    
+    The agent's HTTP pools, caches and (warm) browser are shared by all
+    queries, so only the first one pays the startup costs. A failed query
+    is recorded and the batch carries on. The trace of every successful
+    query is appended to `traces` if given.
+    """
+    config = replace(config, keep_browser_warm=True)
+    latencies = []
+    failures = 0
+    cost = 0.0
+    start = time.perf_counter()
+    
+    async with ResearchAgent(config) as agent:
+        with open(output_path, "w") as out:
+            for i, item in enumerate(items, 1):
+                print(f"\n📚 [{i}/{len(items)}] {item['query'][:70]}", flush=True)
+                query_start = time.perf_counter()
+                line: Dict[str, Any] = {"id": item["id"], "query": item["query"]}
+                try:
+                    report = await agent.research(item["query"])
+                    cost += report.cost_estimate_usd
+                    line.update(ok=True, report=report.to_dict())
+                    if traces is not None:
+                        traces.append(report.trace)
+                except Exception as e:
+                    failures += 1
+                    print(f"   ❌ Failed: {type(e).__name__}: {e}")
+                    line.update(ok=False, error=f"{type(e).__name__}: {e}")
+                line["latency_s"] = time.perf_counter() - query_start
+                latencies.append(line["latency_s"])
+                out.write(json.dumps(line, default=str) + "\n")
+                out.flush()
+    
+    wall_s = time.perf_counter() - start
+    return {
+        "queries": len(items),
+        "succeeded": len(items) - failures,
+        "failed": failures,
+        "wall_s": wall_s,
+        "queries_per_min": len(items) / wall_s * 60 if wall_s else 0.0,
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p90_s": percentile(latencies, 90),
+        "latency_p95_s": percentile(latencies, 95),
+        "latency_max_s": max(latencies, default=0.0),
+        "cost_usd": cost
+    }
+
+
 async def main():
     """CLI entry point"""
     import argparse
     
     parser = argparse.ArgumentParser(description="Freddy Research Agent - Moonshot Only")
-    parser.add_argument("query", help="Research query")
+    parser.add_argument("query", nargs="?", help="Research query")
     parser.add_argument("--output", "-o", help="Output file (default: print to stdout)")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="Research every query in a .txt (one per line) or .jsonl file; "
+                             "results go to -o or FILE.results.jsonl")
     parser.add_argument("--max-queries", type=int, default=10, help="Max search queries")
     parser.add_argument("--max-pages", type=int, default=20, help="Max pages to crawl")
     parser.add_argument("--fast-model", default="kimi-k2-turbo-preview", help="Model for analysis")
     parser.add_argument("--strong-model", default="kimi-k2.5", help="Model for synthesis")
+    parser.add_argument("--brave-tier", default=os.getenv("BRAVE_TIER", "free"),
+                        choices=sorted(BRAVE_RATE_TIERS), help="Brave Search plan (sets rate limit)")
+    parser.add_argument("--no-search-cache", action="store_true",
+                        help="Always query Brave instead of using cached results")
+    parser.add_argument("--crawl-deadline", type=float, default=120.0,
+                        help="Seconds before the crawl stage stops and keeps what it has (0: no deadline)")
+    parser.add_argument("--hedge", type=float, default=1.0,
+                        help="Start this multiple of --max-pages crawls, cancel the rest once enough succeed")
+    parser.add_argument("--fetch-mode", default="auto", choices=ContentCrawler.FETCH_MODES,
+                        help="auto: plain HTTP first, headless browser only for JS pages; browser: always render")
+    parser.add_argument("--markdown-pool", action="store_true",
+                        help="Convert HTML to markdown in a process pool (one worker per core) "
+                             "instead of the event loop")
+    parser.add_argument("--resource-profile", default="lean", choices=sorted(RESOURCE_PROFILES),
+                        help="Browser sub-requests to block (images, fonts, ads, third-party scripts)")
+    parser.add_argument("--no-crawl-cache", action="store_true",
+                        help="Re-render every page instead of using cached crawls")
+    parser.add_argument("--no-llm-cache", action="store_true",
+                        help="Always call Moonshot instead of using cached responses")
+    parser.add_argument("--replay", action="store_true",
+                        help="Serve LLM calls only from the cache; fail on a miss")
+    parser.add_argument("--planning", default="structured", choices=QueryAnalyzer.PLANNING_MODES,
+                        help="structured: one JSON call for sub-topics and prioritized queries; "
+                             "keywords: a plain list of queries")
+    parser.add_argument("--synthesis-mode", default="single", choices=SynthesisEngine.MODES,
+                        help="single: one call over source previews; map_reduce: summarize every source first")
+    parser.add_argument("--no-stream", action="store_true",
+                        help="Wait for the full report instead of writing it as it is generated")
+    parser.add_argument("--record-cassette", metavar="FILE",
+                        help="Record all Brave, Moonshot and crawl responses to FILE (bypasses caches)")
+    parser.add_argument("--replay-cassette", metavar="FILE",
+                        help="Serve all Brave, Moonshot and crawl requests from a recorded FILE, offline")
+    parser.add_argument("--replay-latency", default="original", metavar="original|zero|FACTOR",
+                        help="Replay with the recorded latencies, none, or scaled by FACTOR")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Write per-stage spans and latency percentiles (JSON) to FILE")
     
     args = parser.parse_args()
+    if (args.query is None) == (args.batch is None):
+        parser.error("give either a query or --batch FILE")
+    if args.record_cassette and args.replay_cassette:
+        parser.error("--record-cassette and --replay-cassette are mutually exclusive")
+    try:
+        latency_scale = {"original": 1.0, "zero": 0.0}.get(args.replay_latency)
+        if latency_scale is None:
+            latency_scale = float(args.replay_latency)
+    except ValueError:
+        parser.error(f"--replay-latency: expected original, zero or a number, got '{args.replay_latency}'")
     
     # Load config from environment
     config = ResearchConfig(
@@ -469,39 +3676,102 @@ async def main():
         max_search_queries=args.max_queries,
         max_crawl_urls=args.max_pages,
         fast_model=args.fast_model,
-        strong_model=args.strong_model
+        strong_model=args.strong_model,
+        brave_tier=args.brave_tier,
+        enable_search_cache=not args.no_search_cache,
+        crawl_stage_timeout=args.crawl_deadline if args.crawl_deadline > 0 else None,
+        crawl_hedge_factor=args.hedge,
+        crawl_fetch_mode=args.fetch_mode,
+        browser_resource_profile=args.resource_profile,
+        markdown_workers=(os.cpu_count() or 1) if args.markdown_pool else 0,
+        enable_crawl_cache=not args.no_crawl_cache,
+        enable_llm_cache=not args.no_llm_cache,
+        llm_replay=args.replay,
+        synthesis_mode=args.synthesis_mode,
+        planning_mode=args.planning,
+        cassette_path=args.record_cassette or args.replay_cassette,
+        cassette_mode="record" if args.record_cassette else "replay",
+        cassette_latency_scale=latency_scale
     )
     
-    if not config.moonshot_api_key:
+    if not config.moonshot_api_key and not config.llm_replay and not args.replay_cassette:
         print("❌ Error: Set MOONSHOT_API_KEY environment variable")
         print("   Get key from: https://platform.moonshot.cn/")
         return
     
-    if not config.brave_api_key:
+    if not config.brave_api_key and not args.replay_cassette:
         print("❌ Error: Set BRAVE_API_KEY environment variable")
         print("   Get free key from: https://api.search.brave.com/")
         print("   (2,000 free queries per month)")
         return
     
+    if args.batch:
+        items = load_batch(args.batch)
+        output_path = args.output or os.path.splitext(args.batch)[0] + ".results.jsonl"
+        traces: Optional[List[Trace]] = [] if args.trace else None
+        summary = await run_batch(config, items, output_path, traces)
+        if traces is not None:
+            write_trace(args.trace, traces)
+        print(f"\n📊 Batch summary ({output_path}):")
+        print(f"   Queries: {summary['succeeded']} succeeded / {summary['failed']} failed "
+              f"in {summary['wall_s']:.0f}s ({summary['queries_per_min']:.2f} queries/min)")
+        print(f"   Latency: p50 {summary['latency_p50_s']:.1f}s, p90 {summary['latency_p90_s']:.1f}s, "
+              f"p95 {summary['latency_p95_s']:.1f}s, max {summary['latency_max_s']:.1f}s")
+        print(f"   Total cost: ${summary['cost_usd']:.3f} USD")
+        if traces is not None:
+            print(f"   Trace: {args.trace}")
+        return
+    
+    # Stream the report to the output file or stdout as it is generated
+    output_file = open(args.output, 'w') if args.output else None
+    on_token = None
+    if not args.no_stream:
+        if output_file:
+            def on_token(token: str):
+                output_file.write(token)
+                output_file.flush()
+        else:
+            banner_printed = False
+            
+            def on_token(token: str):
+                nonlocal banner_printed
+                if not banner_printed:
+                    print("="*80)
+                    banner_printed = True
+                print(token, end="", flush=True)
+    
     # Run research
-    agent = ResearchAgent(config)
-    report = await agent.research(args.query)
-    
-    # Output
-    if args.output:
-        with open(args.output, 'w') as f:
-            f.write(report.markdown)
-        print(f"\n📄 Report saved to: {args.output}")
-    else:
-        print("\n" + "="*80)
-        print(report.markdown)
-        print("="*80)
+    try:
+        async with ResearchAgent(config) as agent:
+            report = await agent.research(args.query, on_token=on_token)
+        if args.trace:
+            write_trace(args.trace, [report.trace])
+        
+        # Output
+        if output_file:
+            if on_token is None:
+                output_file.write(report.markdown)
+            print(f"\n📄 Report saved to: {args.output}")
+        elif on_token is None:
+            print("\n" + "="*80)
+            print(report.markdown)
+            print("="*80)
+    finally:
+        if output_file:
+            output_file.close()
     
     print(f"\n📊 Summary:")
     print(f"   Sources: {len(report.sources)}")
     print(f"   Search queries: {len(report.search_queries)}")
     print(f"   Tokens: {report.token_usage['input_tokens']:,} in / {report.token_usage['output_tokens']:,} out")
     print(f"   Total cost: ${report.cost_estimate_usd:.3f} USD")
+    if "synthesis_ttft_s" in report.timings:
+        print(f"   Latency: {report.timings['total_s']:.1f}s "
+              f"(report first token after {report.timings['synthesis_ttft_s']:.1f}s of synthesis)")
+    else:
+        print(f"   Latency: {report.timings['total_s']:.1f}s")
+    if args.trace:
+        print(f"   Trace: {args.trace}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,389 @@
+"""
+Freddy Research Daemon - keeps a research agent warm between runs
+
+Every `agent.py` invocation pays for Python imports, the Playwright driver,
+Chromium startup and fresh TLS connections to Brave and Moonshot before any
+research starts. The daemon pays those once: it holds a single
+ResearchAgent (one AsyncWebCrawler/Chromium, one OpenAI client, one Brave
+session) and serves research jobs over a Unix socket or localhost TCP.
+
+Protocol: newline-delimited JSON. The client sends one request line and the
+daemon streams events back until the job ends:
+
+    -> {"action": "research", "query": "...", "options": {"max_crawl_urls": 10}}
+    <- {"event": "accepted", "position": 0}
+    <- {"event": "log", "text": "🎯 Planning research..."}
+    <- {"event": "token", "text": "## Exec"}
+    <- {"event": "done", "report": {...}}        (or {"event": "error", ...})
+
+Other actions: "status" and "shutdown". Jobs run one at a time on the shared
+agent, so the per-run counters in each report stay accurate; further jobs
+wait their turn.
+
+Usage:
+    python src/daemon.py serve                      # Unix socket (default)
+    python src/daemon.py serve --port 8765          # localhost TCP instead
+    python src/daemon.py research "Topic here" -o report.md
+    python src/daemon.py status
+    python src/daemon.py stop
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Optional
+
+# The client must start fast, so `agent` (Crawl4AI, OpenAI, NumPy) is only
+# imported by the server
+DEFAULT_SOCKET = os.path.join(
+    os.getenv("XDG_RUNTIME_DIR") or os.path.join(
+        os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+        "freddy-research-agent"
+    ),
+    "freddy-research.sock"
+)
+
+# ResearchConfig fields a job may override; they are read per run, while
+# everything else is baked into the warm clients when the daemon starts
+JOB_OPTIONS = {
+    "max_search_queries", "max_crawl_urls", "crawl_stage_timeout",
+    "crawl_hedge_factor", "context_token_budget", "dedup_snippets"
+}
+
+# Large enough for one request line carrying a long query
+STREAM_LIMIT = 1 << 20
+
+
+# =============================================================================
+# SERVER
+# =============================================================================
+
+class _EventStream:
+    """File-like object that forwards printed progress lines as log events"""
+    
+    def __init__(self, send):
+        self._send = send
+        self._buffer = ""
+    
+    def write(self, text: str) -> int:
+        self._buffer += text
+        while "\n" in self._buffer:
+            line, self._buffer = self._buffer.split("\n", 1)
+            self._send({"event": "log", "text": line})
+        return len(text)
+    
+    def flush(self):
+        pass
+
+
+class ResearchDaemon:
+    """Serves research jobs from one long-lived ResearchAgent"""
+    
+    def __init__(self, config, prewarm: bool = True):
+        from agent import ResearchAgent
+        
+        config.keep_browser_warm = True
+        self.config = config
+        self.agent = ResearchAgent(config)
+        self.prewarm = prewarm
+        self.started = time.time()
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self._waiting = 0
+        self._job_lock = asyncio.Lock()
+        self._stopped = asyncio.Event()
+        self._server: Optional[asyncio.AbstractServer] = None
+    
+    async def start(self, socket_path: Optional[str] = None, host: str = "127.0.0.1",
+                    port: Optional[int] = None):
+        """Listen on localhost TCP if `port` is given, otherwise on a Unix socket"""
+        if self.prewarm and self.config.crawl_fetch_mode == "browser":
+            await self.agent.crawler.warm_up()
+        elif self.prewarm:
+            # In auto mode most pages never need Chromium; launch it in the
+            # background so neither startup nor the first JS page waits
+            asyncio.create_task(self._warm_browser())
+        
+        if port is not None:
+            self._server = await asyncio.start_server(
+                self._handle, host, port, limit=STREAM_LIMIT
+            )
+            return f"{host}:{port}"
+        
+        os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+        if os.path.exists(socket_path):
+            if await _socket_alive(socket_path):
+                raise RuntimeError(f"A daemon is already listening on {socket_path}")
+            os.unlink(socket_path)   # Left behind by a daemon that was killed
+        self._server = await asyncio.start_unix_server(
+            self._handle, socket_path, limit=STREAM_LIMIT
+        )
+        os.chmod(socket_path, 0o600)
+        return socket_path
+    
+    async def _warm_browser(self):
+        try:
+            await self.agent.crawler.warm_up()
+        except Exception as e:
+            print(f"⚠️  Browser warm-up failed (will retry on first JS page): {e}")
+    
+    async def serve_until_stopped(self):
+        await self._stopped.wait()
+        self._server.close()
+        await self._server.wait_closed()
+        # Let a running job finish before tearing the agent down
+        async with self._job_lock:
+            await self.agent.close()
+    
+    def status(self) -> Dict[str, Any]:
+        return {
+            "uptime_s": time.time() - self.started,
+            "jobs_done": self.jobs_done,
+            "jobs_failed": self.jobs_failed,
+            "busy": self._job_lock.locked(),
+            "waiting": self._waiting,
+            "pid": os.getpid()
+        }
+    
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        def send(event: Dict[str, Any]):
+            if not writer.is_closing():
+                writer.write(json.dumps(event, default=str).encode() + b"\n")
+        
+        try:
+            line = await reader.readline()
+            try:
+                request = json.loads(line)
+            except ValueError:
+                send({"event": "error", "message": "Request must be one line of JSON"})
+                return
+            
+            action = request.get("action", "research")
+            if action == "status":
+                send({"event": "status", **self.status()})
+            elif action == "shutdown":
+                send({"event": "stopping"})
+                self._stopped.set()
+            elif action == "research":
+                await self._run_job(request, send, writer)
+            else:
+                send({"event": "error", "message": f"Unknown action '{action}'"})
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass   # Client went away; a running job still completes
+        finally:
+            writer.close()
+    
+    async def _run_job(self, request: Dict[str, Any], send, writer: asyncio.StreamWriter):
+        from dataclasses import replace
+        
+        query = (request.get("query") or "").strip()
+        options = request.get("options") or {}
+        unknown = set(options) - JOB_OPTIONS
+        if not query:
+            send({"event": "error", "message": "Missing 'query'"})
+            return
+        if unknown:
+            send({"event": "error", "message": f"Unsupported options: {', '.join(sorted(unknown))}"})
+            return
+        
+        send({"event": "accepted", "position": self._waiting + self._job_lock.locked()})
+        await writer.drain()
+        
+        self._waiting += 1
+        try:
+            await self._job_lock.acquire()
+        finally:
+            self._waiting -= 1
+        base_config = self.agent.config
+        self.agent.config = replace(base_config, **options)
+        try:
+            # Jobs are serialized, so progress prints belong to this client
+            with contextlib.redirect_stdout(_EventStream(send)):
+                report = await self.agent.research(
+                    query,
+                    on_token=(lambda t: send({"event": "token", "text": t}))
+                    if request.get("stream", True) else None
+                )
+            send({"event": "done", "report": report.to_dict()})
+            self.jobs_done += 1
+        except Exception as e:
+            send({"event": "error", "message": f"{type(e).__name__}: {e}"})
+            self.jobs_failed += 1
+        finally:
+            self.agent.config = base_config
+            self._job_lock.release()
+
+
+async def _socket_alive(socket_path: str) -> bool:
+    try:
+        _, writer = await asyncio.open_unix_connection(socket_path)
+    except OSError:
+        return False
+    writer.close()
+    return True
+
+
+async def serve(args):
+    from agent import ResearchConfig
+    
+    config = ResearchConfig(
+        moonshot_api_key=os.getenv("MOONSHOT_API_KEY"),
+        brave_api_key=os.getenv("BRAVE_API_KEY"),
+        fast_model=args.fast_model,
+        strong_model=args.strong_model,
+        brave_tier=args.brave_tier,
+        crawl_fetch_mode=args.fetch_mode,
+        browser_resource_profile=args.resource_profile,
+        synthesis_mode=args.synthesis_mode,
+        planning_mode=args.planning
+    )
+    daemon = ResearchDaemon(config, prewarm=not args.no_prewarm)
+    address = await daemon.start(args.socket, port=args.port)
+    print(f"🌙 Research daemon ready on {address} (pid {os.getpid()})", flush=True)
+    try:
+        await daemon.serve_until_stopped()
+    finally:
+        if args.port is None and os.path.exists(args.socket):
+            os.unlink(args.socket)
+    print("👋 Research daemon stopped")
+
+
+# =============================================================================
+# CLIENT
+# =============================================================================
+
+async def _connect(args):
+    if args.port is not None:
+        return await asyncio.open_connection(args.host, args.port, limit=STREAM_LIMIT)
+    return await asyncio.open_unix_connection(args.socket, limit=STREAM_LIMIT)
+
+
+async def request(args, payload: Dict[str, Any]):
+    """Send one request and yield the daemon's events as they arrive"""
+    try:
+        reader, writer = await _connect(args)
+    except OSError as e:
+        where = f"{args.host}:{args.port}" if args.port is not None else args.socket
+        raise SystemExit(f"❌ No research daemon at {where} ({e}); start one with: "
+                         f"python src/daemon.py serve")
+    writer.write(json.dumps(payload).encode() + b"\n")
+    await writer.drain()
+    try:
+        while line := await reader.readline():
+            yield json.loads(line)
+    finally:
+        writer.close()
+
+
+async def research(args) -> int:
+    options = {}
+    if args.max_queries is not None:
+        options["max_search_queries"] = args.max_queries
+    if args.max_pages is not None:
+        options["max_crawl_urls"] = args.max_pages
+    
+    output_file = open(args.output, "w") if args.output else None
+    start = time.perf_counter()
+    report = None
+    try:
+        async for event in request(args, {
+            "action": "research",
+            "query": args.query,
+            "options": options,
+            "stream": not args.no_stream
+        }):
+            kind = event["event"]
+            if kind == "accepted" and event["position"]:
+                print(f"⏳ Queued behind {event['position']} job(s)", file=sys.stderr)
+            elif kind == "log" and not args.quiet:
+                print(event["text"], file=sys.stderr)
+            elif kind == "token":
+                if output_file:
+                    output_file.write(event["text"])
+                    output_file.flush()
+                else:
+                    print(event["text"], end="", flush=True)
+            elif kind == "done":
+                report = event["report"]
+            elif kind == "error":
+                print(f"❌ {event['message']}", file=sys.stderr)
+                return 1
+    finally:
+        if output_file:
+            output_file.close()
+    
+    if report is None:
+        print("❌ Daemon closed the connection before the report was done", file=sys.stderr)
+        return 1
+    if args.no_stream:
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(report["markdown"])
+        else:
+            print(report["markdown"])
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    
+    print(f"\n📊 {len(report['sources'])} sources, ${report['cost_estimate_usd']:.3f}, "
+          f"{time.perf_counter() - start:.1f}s end to end", file=sys.stderr)
+    return 0
+
+
+async def simple(args, action: str) -> int:
+    async for event in request(args, {"action": action}):
+        print(json.dumps(event, indent=2))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Freddy Research Agent - warm daemon and client")
+    parser.add_argument("--socket", default=os.getenv("FREDDY_SOCKET", DEFAULT_SOCKET),
+                        help="Unix socket path")
+    parser.add_argument("--host", default="127.0.0.1", help="TCP host (with --port)")
+    parser.add_argument("--port", type=int, help="Use localhost TCP on this port instead of a socket")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    serve_parser = commands.add_parser("serve", help="Run the daemon in the foreground")
+    serve_parser.add_argument("--fast-model", default="kimi-k2-turbo-preview", help="Model for analysis")
+    serve_parser.add_argument("--strong-model", default="kimi-k2.5", help="Model for synthesis")
+    serve_parser.add_argument("--brave-tier", default=os.getenv("BRAVE_TIER", "free"),
+                              help="Brave Search plan (sets rate limit)")
+    serve_parser.add_argument("--fetch-mode", default="auto", choices=("auto", "browser"),
+                              help="auto: plain HTTP first, headless browser only for JS pages")
+    serve_parser.add_argument("--resource-profile", default="lean", choices=("lean", "off", "strict"),
+                              help="Browser sub-requests to block")
+    serve_parser.add_argument("--synthesis-mode", default="single", choices=("single", "map_reduce"))
+    serve_parser.add_argument("--planning", default="structured", choices=("structured", "keywords"))
+    serve_parser.add_argument("--no-prewarm", action="store_true",
+                              help="Launch Chromium on the first rendered page instead of at startup")
+    
+    research_parser = commands.add_parser("research", help="Submit a research job")
+    research_parser.add_argument("query", help="Research query")
+    research_parser.add_argument("--output", "-o", help="Output file (default: print to stdout)")
+    research_parser.add_argument("--json", help="Also write the full report as JSON here")
+    research_parser.add_argument("--max-queries", type=int, help="Max search queries")
+    research_parser.add_argument("--max-pages", type=int, help="Max pages to crawl")
+    research_parser.add_argument("--no-stream", action="store_true",
+                                 help="Wait for the full report instead of streaming it")
+    research_parser.add_argument("--quiet", "-q", action="store_true", help="Hide progress lines")
+    
+    commands.add_parser("status", help="Show daemon status")
+    commands.add_parser("stop", help="Stop the daemon after the running job")
+    
+    args = parser.parse_args()
+    if args.command == "serve":
+        asyncio.run(serve(args))
+    elif args.command == "research":
+        sys.exit(asyncio.run(research(args)))
+    else:
+        sys.exit(asyncio.run(simple(args, "shutdown" if args.command == "stop" else "status")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,524 @@
+"""
+Freddy Research Jobs - persistent job queue and multi-process worker pool
+
+Research jobs are stored in SQLite (priority first, then submission order)
+and executed by a pool of worker processes, each holding one warm
+ResearchAgent. Global caps are shared by every worker so the pool as a whole
+stays inside the API quotas:
+
+- Brave: one request-rate schedule in shared memory (plus Retry-After /
+  X-RateLimit backoff seen by any worker)
+- Moonshot: a cap on concurrent completion calls
+- Crawl: a cap on concurrent live page fetches (cache hits are free)
+
+A job left `running` by a worker that died is re-queued when the next pool
+starts (up to MAX_ATTEMPTS).
+
+Usage:
+    python src/jobs.py submit "Topic A" "Topic B" --priority 5
+    python src/jobs.py work --workers 4 --llm-concurrency 8 --crawl-concurrency 16
+    python src/jobs.py work --workers 4 --drain     # exit once the queue is empty
+    python src/jobs.py status
+    python src/jobs.py show 12
+    python src/jobs.py result 12 -o report.md
+    python src/jobs.py cancel 13
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import signal
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional
+
+from daemon import JOB_OPTIONS
+
+DEFAULT_QUEUE = os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+    "freddy-research-agent",
+    "jobs.db"
+)
+
+JOB_STATUSES = ("queued", "running", "done", "failed", "cancelled")
+MAX_ATTEMPTS = 3
+
+
+# =============================================================================
+# JOB QUEUE
+# =============================================================================
+
+class JobQueue:
+    """
+    SQLite-backed research job queue, safe to share between processes.
+    
+    Each process opens its own JobQueue on the same file. `claim` takes the
+    highest-priority, oldest queued job inside an IMMEDIATE transaction, so
+    two workers never run the same job.
+    """
+    
+    def __init__(self, path: str = DEFAULT_QUEUE):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                query TEXT NOT NULL,
+                options TEXT NOT NULL DEFAULT '{}',
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                pid INTEGER,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                error TEXT,
+                log TEXT,
+                result TEXT
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_queued ON jobs(status, priority DESC, id)"
+        )
+    
+    def submit(self, query: str, priority: int = 0, options: Optional[Dict[str, Any]] = None) -> int:
+        """Queue a job; higher `priority` runs first. Returns the job id."""
+        options = options or {}
+        unknown = set(options) - JOB_OPTIONS
+        if unknown:
+            raise ValueError(f"Unsupported job options: {', '.join(sorted(unknown))}")
+        cursor = self._conn.execute(
+            "INSERT INTO jobs (query, options, priority, created_at) VALUES (?, ?, ?, ?)",
+            (query, json.dumps(options), priority, time.time())
+        )
+        return cursor.lastrowid
+    
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """Atomically mark the next queued job as running and return it"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY priority DESC, id LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, pid = ?, started_at = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (worker, os.getpid(), time.time(), row["id"])
+                )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return self._job(row) if row is not None else None
+    
+    def complete(self, job_id: int, result: Dict[str, Any], log: str = ""):
+        self._conn.execute(
+            "UPDATE jobs SET status = 'done', finished_at = ?, result = ?, log = ?, error = NULL "
+            "WHERE id = ?",
+            (time.time(), json.dumps(result, default=str), log, job_id)
+        )
+    
+    def fail(self, job_id: int, error: str, log: str = ""):
+        self._conn.execute(
+            "UPDATE jobs SET status = 'failed', finished_at = ?, error = ?, log = ? WHERE id = ?",
+            (time.time(), error, log, job_id)
+        )
+    
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a job that has not started yet"""
+        cursor = self._conn.execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? "
+            "WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id)
+        )
+        return cursor.rowcount > 0
+    
+    def requeue_orphans(self) -> int:
+        """Re-queue running jobs whose worker process no longer exists"""
+        requeued = 0
+        rows = self._conn.execute(
+            "SELECT id, pid, attempts FROM jobs WHERE status = 'running'"
+        ).fetchall()
+        for row in rows:
+            if row["pid"] and _pid_alive(row["pid"]):
+                continue
+            if row["attempts"] >= MAX_ATTEMPTS:
+                self.fail(row["id"], f"Worker died {row['attempts']} times")
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL, pid = NULL WHERE id = ?",
+                    (row["id"],)
+                )
+                requeued += 1
+        return requeued
+    
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row is not None else None
+    
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Most recent jobs first, without their results"""
+        sql = ("SELECT id, query, priority, status, attempts, worker, created_at, "
+               "started_at, finished_at, error FROM jobs")
+        params: tuple = ()
+        if status:
+            sql += " WHERE status = ?"
+            params = (status,)
+        rows = self._conn.execute(sql + " ORDER BY id DESC LIMIT ?", params + (limit,)).fetchall()
+        return [dict(row) for row in rows]
+    
+    def counts(self) -> Dict[str, int]:
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        for status, n in self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+            counts[status] = n
+        return counts
+    
+    def _job(self, row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["options"] = json.loads(job["options"] or "{}")
+        if job.get("result"):
+            job["result"] = json.loads(job["result"])
+        return job
+    
+    def close(self):
+        self._conn.close()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# =============================================================================
+# GLOBAL LIMITS (shared across worker processes)
+# =============================================================================
+
+@dataclass
+class PoolLimits:
+    """Caps for the whole pool, not per worker"""
+    brave_rps: Optional[float] = None     # None: the configured Brave plan's rate
+    llm_concurrency: int = 8              # Concurrent Moonshot calls
+    crawl_concurrency: int = 16           # Concurrent live page fetches
+
+
+class SharedSlots:
+    """Async context manager over a multiprocessing semaphore"""
+    
+    def __init__(self, semaphore):
+        self._semaphore = semaphore
+    
+    async def __aenter__(self) -> "SharedSlots":
+        # Poll instead of blocking so the worker's event loop keeps running
+        delay = 0.005
+        while not self._semaphore.acquire(block=False):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        self._semaphore.release()
+
+
+# =============================================================================
+# WORKER POOL
+# =============================================================================
+
+def _worker_main(name: str, queue_path: str, config, rate: float, brave_state,
+                 llm_slots, crawl_slots, stop, drain: bool, poll_interval: float):
+    # Ctrl-C goes to the whole process group; the pool tells workers to stop
+    # after their current job instead
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_work(name, queue_path, config, rate, brave_state,
+                      llm_slots, crawl_slots, stop, drain, poll_interval))
+
+
+async def _work(name: str, queue_path: str, config, rate: float, brave_state,
+                llm_slots, crawl_slots, stop, drain: bool, poll_interval: float):
+    from agent import ResearchAgent, SharedTokenBucket
+    
+    queue = JobQueue(queue_path)
+    agent = ResearchAgent(
+        config,
+        brave_limiter=SharedTokenBucket(rate, brave_state),
+        llm_limiter=SharedSlots(llm_slots),
+        crawl_limiter=SharedSlots(crawl_slots)
+    )
+    try:
+        while not stop.is_set():
+            job = queue.claim(name)
+            if job is None:
+                if drain:
+                    return
+                await asyncio.sleep(poll_interval)
+                continue
+            
+            print(f"[{name}] ▶ job {job['id']}: {job['query'][:60]}", flush=True)
+            log = io.StringIO()
+            agent.config = replace(config, **job["options"])
+            start = time.perf_counter()
+            try:
+                with contextlib.redirect_stdout(log):
+                    report = await agent.research(job["query"])
+            except Exception as e:
+                queue.fail(job["id"], f"{type(e).__name__}: {e}", log.getvalue())
+                print(f"[{name}] ✗ job {job['id']} failed: {e}", flush=True)
+            else:
+                queue.complete(job["id"], report.to_dict(), log.getvalue())
+                print(f"[{name}] ✓ job {job['id']} in {time.perf_counter() - start:.1f}s "
+                      f"(${report.cost_estimate_usd:.3f})", flush=True)
+            finally:
+                agent.config = config
+    finally:
+        await agent.close()
+        queue.close()
+
+
+class WorkerPool:
+    """
+    Runs research jobs from a JobQueue in `workers` processes.
+    
+    Workers use the spawn start method (Playwright and a running event loop
+    do not survive fork) and each keeps its browser warm between jobs.
+    """
+    
+    def __init__(self, config, queue_path: str = DEFAULT_QUEUE, workers: int = 2,
+                 limits: Optional[PoolLimits] = None, poll_interval: float = 1.0):
+        from agent import BRAVE_RATE_TIERS
+        
+        self.config = replace(config, keep_browser_warm=True)
+        self.queue_path = queue_path
+        self.workers = workers
+        self.limits = limits or PoolLimits()
+        self.poll_interval = poll_interval
+        if config.brave_tier not in BRAVE_RATE_TIERS:
+            raise ValueError(
+                f"Unknown brave_tier '{config.brave_tier}' "
+                f"(expected one of: {', '.join(BRAVE_RATE_TIERS)})"
+            )
+        self.brave_rps = (self.limits.brave_rps or config.brave_rate_limit
+                          or BRAVE_RATE_TIERS[config.brave_tier])
+        self._ctx = multiprocessing.get_context("spawn")
+        self._stop = self._ctx.Event()
+        self._processes: List[multiprocessing.Process] = []
+        self._shared: tuple = ()
+    
+    def start(self, drain: bool = False):
+        queue = JobQueue(self.queue_path)
+        requeued = queue.requeue_orphans()
+        queue.close()
+        if requeued:
+            print(f"↩️  Re-queued {requeued} job(s) from workers that died")
+        
+        # Kept on self: the semaphores must outlive start() until every
+        # spawned worker has unpickled them
+        self._shared = (
+            self._ctx.Value("d", 0.0),
+            self._ctx.BoundedSemaphore(self.limits.llm_concurrency),
+            self._ctx.BoundedSemaphore(self.limits.crawl_concurrency)
+        )
+        brave_state, llm_slots, crawl_slots = self._shared
+        for i in range(self.workers):
+            process = self._ctx.Process(
+                target=_worker_main,
+                name=f"research-worker-{i}",
+                args=(f"w{i}", self.queue_path, self.config, self.brave_rps, brave_state,
+                      llm_slots, crawl_slots, self._stop, drain, self.poll_interval),
+                daemon=False
+            )
+            process.start()
+            self._processes.append(process)
+    
+    def stop(self):
+        """Ask workers to exit after their current job"""
+        self._stop.set()
+    
+    def join(self):
+        for process in self._processes:
+            process.join()
+    
+    def terminate(self):
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+        self.join()
+
+
+# =============================================================================
+# CLI INTERFACE
+# =============================================================================
+
+def _format_time(ts: Optional[float]) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts)) if ts else "-"
+
+
+def _job_options(args) -> Dict[str, Any]:
+    options = {}
+    if args.max_queries is not None:
+        options["max_search_queries"] = args.max_queries
+    if args.max_pages is not None:
+        options["max_crawl_urls"] = args.max_pages
+    return options
+
+
+def work(args):
+    from agent import ResearchConfig
+    
+    config = ResearchConfig(
+        moonshot_api_key=os.getenv("MOONSHOT_API_KEY"),
+        brave_api_key=os.getenv("BRAVE_API_KEY"),
+        fast_model=args.fast_model,
+        strong_model=args.strong_model,
+        brave_tier=args.brave_tier,
+        crawl_fetch_mode=args.fetch_mode
+    )
+    if not config.moonshot_api_key or not config.brave_api_key:
+        sys.exit("❌ Error: Set MOONSHOT_API_KEY and BRAVE_API_KEY environment variables")
+    
+    pool = WorkerPool(
+        config,
+        queue_path=args.queue,
+        workers=args.workers,
+        limits=PoolLimits(
+            brave_rps=args.brave_rps,
+            llm_concurrency=args.llm_concurrency,
+            crawl_concurrency=args.crawl_concurrency
+        )
+    )
+    pool.start(drain=args.drain)
+    print(f"🌙 {args.workers} workers on {args.queue} (Brave {pool.brave_rps:g} req/s, "
+          f"{args.llm_concurrency} LLM calls, {args.crawl_concurrency} fetches)", flush=True)
+    try:
+        pool.join()
+    except KeyboardInterrupt:
+        print("\n⏹️  Stopping after current jobs (Ctrl-C again to abort them)", flush=True)
+        pool.stop()
+        try:
+            pool.join()
+        except KeyboardInterrupt:
+            pool.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Freddy Research Agent - job queue and worker pool")
+    parser.add_argument("--queue", default=os.getenv("FREDDY_JOB_QUEUE", DEFAULT_QUEUE),
+                        help="SQLite job queue file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    submit_parser = commands.add_parser("submit", help="Queue research jobs")
+    submit_parser.add_argument("queries", nargs="+", help="Research queries (one job each)")
+    submit_parser.add_argument("--priority", type=int, default=0, help="Higher runs first")
+    submit_parser.add_argument("--max-queries", type=int, help="Max search queries")
+    submit_parser.add_argument("--max-pages", type=int, help="Max pages to crawl")
+    
+    work_parser = commands.add_parser("work", help="Run a worker pool in the foreground")
+    work_parser.add_argument("--workers", type=int, default=max(1, min(4, os.cpu_count() or 1)),
+                             help="Worker processes")
+    work_parser.add_argument("--brave-rps", type=float,
+                             help="Brave requests/sec for the whole pool (default: plan rate)")
+    work_parser.add_argument("--llm-concurrency", type=int, default=8,
+                             help="Concurrent Moonshot calls across all workers")
+    work_parser.add_argument("--crawl-concurrency", type=int, default=16,
+                             help="Concurrent live page fetches across all workers")
+    work_parser.add_argument("--drain", action="store_true", help="Exit once the queue is empty")
+    work_parser.add_argument("--fast-model", default="kimi-k2-turbo-preview", help="Model for analysis")
+    work_parser.add_argument("--strong-model", default="kimi-k2.5", help="Model for synthesis")
+    work_parser.add_argument("--brave-tier", default=os.getenv("BRAVE_TIER", "free"),
+                             help="Brave Search plan (sets rate limit)")
+    work_parser.add_argument("--fetch-mode", default="auto", choices=("auto", "browser"))
+    
+    status_parser = commands.add_parser("status", help="Queue counts and recent jobs")
+    status_parser.add_argument("--status", choices=JOB_STATUSES, help="Only jobs with this status")
+    status_parser.add_argument("--limit", type=int, default=20)
+    
+    show_parser = commands.add_parser("show", help="Job details and progress log")
+    show_parser.add_argument("job_id", type=int)
+    
+    result_parser = commands.add_parser("result", help="Report of a finished job")
+    result_parser.add_argument("job_id", type=int)
+    result_parser.add_argument("--output", "-o", help="Write the markdown here instead of stdout")
+    result_parser.add_argument("--json", action="store_true", help="Print the full result as JSON")
+    
+    cancel_parser = commands.add_parser("cancel", help="Cancel a queued job")
+    cancel_parser.add_argument("job_id", type=int)
+    
+    args = parser.parse_args()
+    if args.command == "work":
+        work(args)
+        return
+    
+    queue = JobQueue(args.queue)
+    try:
+        if args.command == "submit":
+            for query in args.queries:
+                job_id = queue.submit(query, priority=args.priority, options=_job_options(args))
+                print(f"📥 Job {job_id}: {query}")
+        
+        elif args.command == "status":
+            counts = queue.counts()
+            print("  ".join(f"{status}: {n}" for status, n in counts.items()))
+            for job in queue.list(args.status, args.limit):
+                took = ""
+                if job["started_at"] and job["finished_at"]:
+                    took = f"{job['finished_at'] - job['started_at']:.0f}s"
+                print(f"{job['id']:>5}  {job['status']:<9} p{job['priority']:<3} {took:>5}  "
+                      f"{job['query'][:60]}")
+        
+        elif args.command == "show":
+            job = queue.get(args.job_id)
+            if job is None:
+                sys.exit(f"❌ No job {args.job_id}")
+            result = job.pop("result") or {}
+            log = job.pop("log") or ""
+            for key in ("created_at", "started_at", "finished_at"):
+                job[key] = _format_time(job[key])
+            print(json.dumps(job, indent=2))
+            if result:
+                print(f"Sources: {len(result['sources'])}  Cost: ${result['cost_estimate_usd']:.3f}  "
+                      f"Latency: {result['timings'].get('total_s', 0):.1f}s")
+            if log:
+                print("\n" + log)
+        
+        elif args.command == "result":
+            job = queue.get(args.job_id)
+            if job is None:
+                sys.exit(f"❌ No job {args.job_id}")
+            if job["status"] != "done":
+                sys.exit(f"❌ Job {args.job_id} is {job['status']}"
+                         + (f": {job['error']}" if job["error"] else ""))
+            if args.json:
+                print(json.dumps(job["result"], indent=2))
+            elif args.output:
+                with open(args.output, "w") as f:
+                    f.write(job["result"]["markdown"])
+                print(f"📄 Report saved to: {args.output}")
+            else:
+                print(job["result"]["markdown"])
+        
+        elif args.command == "cancel":
+            if queue.cancel(args.job_id):
+                print(f"🚫 Job {args.job_id} cancelled")
+            else:
+                sys.exit(f"❌ Job {args.job_id} is not queued")
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()